@@ -1,7 +1,21 @@
-import marytreat.ui.first_launch
-from marytreat.ui.main_window import App
+import importlib
+import sys
+
+# Commands that run without the user interface: python -m marytreat <command> --help
+commands: dict[str, str] = {
+    'batch': 'marytreat.core.batch',
+    'rename-plan': 'marytreat.core.rename_plan',
+    'flare-images': 'marytreat.core.flare_images'
+}
 
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in commands:
+        command = importlib.import_module(commands[sys.argv[1]])
+        sys.exit(command.main(sys.argv[2:]))
+
+    import marytreat.ui.first_launch
+    from marytreat.ui.main_window import App
+
     app = App()
     app.mainloop()
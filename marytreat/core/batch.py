@@ -0,0 +1,149 @@
+import argparse
+import logging
+import os
+import sys
+import traceback
+from functools import partial
+from time import perf_counter
+
+from marytreat.core.batch_jobs import run_jobs, summarize, write_summary
+from marytreat.core.mary_debug import logger
+
+"""
+Headless processing of local DITA projects, for many maps at once and without a display.
+
+Usage:
+    python -m marytreat batch <folder or ditamap>... --ops cast rename mass-edit [--jobs 8] [--output results.json]
+
+Folders are searched for ditamaps recursively. Each map is processed in a worker process.
+The results, with the time of each operation, are written as JSON.
+"""
+
+# Operations in the order they are run, whatever the order on the command line
+operations: dict[str, str] = {
+    'cast': 'for Word-derived maps: cast topics to their types and run the Word post-processing',
+    'rename': 'rename topic files according to their titles',
+    'mass-edit': 'add typical shortdescs and process the document details',
+    'image-names': 'rename images according to their titles, with the --image-prefix',
+    'report': 'list topics with missing titles or shortdescs, or with draft comments'
+}
+
+
+def find_maps(paths: list[str]) -> list[str]:
+    """
+    :param paths: ditamaps, or folders to search for ditamaps
+    :return: absolute paths of the maps, each once, in the order given
+    """
+    maps = []
+    for path in paths:
+        if os.path.isfile(path) and path.endswith('.ditamap'):
+            maps.append(os.path.abspath(path))
+        elif os.path.isdir(path):
+            for folder, dirs, files in os.walk(path):
+                dirs.sort()
+                maps += [os.path.abspath(os.path.join(folder, f)) for f in sorted(files) if f.endswith('.ditamap')]
+        else:
+            logger.warning('Not a ditamap or a folder, skipped: %s', path)
+    return list(dict.fromkeys(maps))
+
+
+def run_operation(ditamap, operation: str, image_prefix: str | None = None):
+    """
+    :return: result of the operation that can be written as JSON
+    """
+    if operation == 'cast':
+        if ditamap.source != 'word':
+            return 'skipped: not derived from Word'
+        from marytreat.core import process_word  # requires python-docx
+        ditamap.cast_topics_from_word()
+        process_word.after_conversion(ditamap.folder, ditamap)
+        return len(ditamap.topics)
+    if operation == 'rename':
+        return ditamap.rename_topics()
+    if operation == 'mass-edit':
+        return ditamap.mass_edit()
+    if operation == 'image-names':
+        return ditamap.edit_image_names(image_prefix)
+    if operation == 'report':
+        return [t.name for t in ditamap.get_problematic_files()]
+    raise ValueError('Unknown operation: ' + operation)
+
+
+def process_map(map_path: str, selected: list[str], image_prefix: str | None = None,
+                map_options: dict | None = None) -> dict:
+    """
+    Load a map and run the selected operations on it. A failed operation stops the map, and is recorded in the result.
+    """
+    from marytreat.core.local import LocalMap
+    result = {'map': map_path, 'ok': True, 'operations': []}
+    start = perf_counter()
+    operation = 'load'
+    try:
+        ditamap = LocalMap(map_path, **(map_options or {}))
+        result['operations'].append({'name': 'load', 'seconds': round(perf_counter() - start, 4)})
+        result['source'] = ditamap.source
+        result['topics'] = len(ditamap.topics)
+        for operation in [op for op in operations if op in selected]:
+            op_start = perf_counter()
+            op_result = run_operation(ditamap, operation, image_prefix)
+            result['operations'].append({'name': operation, 'seconds': round(perf_counter() - op_start, 4),
+                                         'result': op_result})
+        if ditamap.index is not None:
+            ditamap.index.close()
+    except Exception as e:
+        logger.warning('Failed to process %s (%s): %s', map_path, operation, e)
+        result['ok'] = False
+        result['error'] = {'operation': operation, 'message': repr(e),
+                           'traceback': traceback.format_exc().splitlines()[-5:]}
+    result['seconds'] = round(perf_counter() - start, 4)
+    return result
+
+
+def failed_map(map_path: str, e: Exception) -> dict:
+    return {'map': map_path, 'ok': False, 'operations': [],
+            'error': {'operation': None, 'message': repr(e), 'traceback': []}}
+
+
+def run_batch(map_paths: list[str], selected: list[str], jobs: int = 1, image_prefix: str | None = None,
+              map_options: dict | None = None, console_log_level: int = logging.WARNING) -> list[dict]:
+    """
+    :param jobs: number of maps processed at the same time, each in its own process
+    :return: results in the order of the maps
+    """
+    job = partial(process_map, selected=selected, image_prefix=image_prefix, map_options=map_options)
+    return run_jobs(job, map_paths, jobs, failed_map, console_log_level)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m marytreat batch',
+                                     description='Process local DITA projects without the user interface.',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog='operations:\n' + '\n'.join('  %-12s %s' % (k, v)
+                                                                        for k, v in operations.items()))
+    parser.add_argument('paths', nargs='+', help='ditamaps, or folders to search for ditamaps')
+    parser.add_argument('--ops', nargs='+', choices=list(operations), default=['report'], metavar='OP',
+                        help='operations to run on each map (default: report)')
+    parser.add_argument('--image-prefix', help='prefix for image names, required by image-names')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='maps processed at the same time')
+    parser.add_argument('--topic-workers', type=int, default=0, help='processes for loading the topics of a map')
+    parser.add_argument('--lazy', action='store_true', help='parse topics only when an operation needs them')
+    parser.add_argument('--use-index', action='store_true', help='keep a project index next to each map')
+    parser.add_argument('--output', help='file for the JSON results (default: standard output)')
+    parser.add_argument('--verbose', action='store_true', help='print informational log messages')
+    args = parser.parse_args(argv)
+    if 'image-names' in args.ops and not args.image_prefix:
+        parser.error('image-names requires --image-prefix')
+
+    map_paths = find_maps(args.paths)
+    if not map_paths:
+        print('No ditamaps found.', file=sys.stderr)
+        return 2
+    map_options = {'workers': args.topic_workers, 'lazy': args.lazy, 'use_index': args.use_index}
+    start = perf_counter()
+    results = run_batch(map_paths, args.ops, args.jobs, args.image_prefix, map_options,
+                        logging.INFO if args.verbose else logging.WARNING)
+    summary = summarize(results, start, {'maps': len(results)})
+    exit_code = write_summary(summary, args.output)
+    print('Processed %d maps, %d failed, in %.1f s' % (summary['maps'], summary['failed'], summary['seconds']),
+          file=sys.stderr)
+    return exit_code
@@ -0,0 +1,70 @@
+import json
+import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+from typing import Callable
+
+from marytreat.core import mary_debug
+from marytreat.core.mary_debug import set_log_level
+
+"""
+Worker pool, progress and JSON summary shared by the command-line tools that process
+many projects or maps at once, ex. python -m marytreat batch and python -m marytreat flare-images.
+A job takes one path and returns a result dictionary with an 'ok' key. It records its own errors
+in the result instead of raising them, so that one broken project does not stop the others.
+"""
+
+
+def init_worker(console_log_level: int) -> None:
+    mary_debug.headless = True
+    set_log_level('console', console_log_level)
+
+
+def run_jobs(job: Callable[[str], dict], paths: list[str], jobs: int = 1,
+             failed_result: Callable[[str, Exception], dict] | None = None,
+             console_log_level: int = logging.WARNING) -> list[dict]:
+    """
+    :param job: module-level function or functools.partial, so that it can be sent to the worker processes
+    :param jobs: number of paths processed at the same time, each in its own process
+    :param failed_result: result for a path whose worker process died
+    :return: results in the order of the paths
+    """
+    init_worker(console_log_level)
+    if jobs <= 1 or len(paths) <= 1:
+        return [job(p) for p in paths]
+    results: dict[str, dict] = {}
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(console_log_level,)) as pool:
+        futures = {pool.submit(job, p): p for p in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                results[path] = future.result()
+            except Exception as e:  # the worker process died
+                results[path] = failed_result(path, e) if failed_result else {'ok': False, 'error': repr(e)}
+            status = 'done' if results[path]['ok'] else 'FAILED'
+            print('[%d/%d] %s: %s' % (len(results), len(paths), status, path), file=sys.stderr)
+    return [results[p] for p in paths]
+
+
+def summarize(results: list[dict], start: float, totals: dict) -> dict:
+    """
+    :param start: perf_counter() value when the run started
+    :param totals: counts to put at the top of the summary, ex. {'maps': 10}
+    """
+    return {**totals, 'failed': sum(1 for r in results if not r['ok']),
+            'seconds': round(perf_counter() - start, 4), 'results': results}
+
+
+def write_summary(summary: dict, output: str | None = None) -> int:
+    """
+    Write the summary as JSON to a file, or to the standard output.
+    :return: exit code of the command, 1 if anything failed
+    """
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=1)
+    else:
+        json.dump(summary, sys.stdout, indent=1)
+        print()
+    return 1 if summary['failed'] else 0
@@ -0,0 +1,178 @@
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from glob import glob
+from itertools import repeat
+from time import perf_counter
+
+from lxml import etree
+
+from marytreat.core.batch_jobs import run_jobs, summarize, write_summary
+from marytreat.core.mary_debug import logger
+
+"""
+Renaming of the images in MadCap Flare projects: every image file gets the img_ prefix,
+and the img sources in the topics are updated.
+
+Usage:
+    python -m marytreat flare-images <Flare project>... [--images GLOB] [--topics GLOB] [--jobs 4] [--output results.json]
+
+The globs are relative to each project folder, and ** matches any number of subfolders.
+"""
+
+image_extensions: tuple[str, ...] = ('.png', '.gif', '.jpg', '.eps', '.cdr', '.wmf')
+image_extensions += tuple(ext.upper() for ext in image_extensions)
+
+default_image_glob: str = 'Content/Resources/Images/final-pics/*'
+default_topic_glob: str = 'Content/MyTopics/*'
+
+
+def find_files(project_path: str, pattern: str) -> list[str]:
+    return sorted(p for p in glob(os.path.join(project_path, pattern), recursive=True) if os.path.isfile(p))
+
+
+def plan_image_names(image_paths: list[str]) -> dict[str, str]:
+    """
+    :return: old image file name -> new image file name
+    """
+    names = (os.path.basename(p) for p in image_paths)
+    return {name: 'img_' + name for name in names if name.endswith(image_extensions)}
+
+
+def rename_links_in_topic(topic_path: str, new_names: dict[str, str]) -> bool:
+    """
+    Update the img sources of one topic, parsing and writing it once.
+    :return: True if the topic has been changed and written
+    """
+    tree = etree.parse(topic_path)
+    changed = False
+    for image in tree.getroot().iter('img', '{http://www.w3.org/1999/xhtml}img'):
+        path = image.attrib.get('src')
+        if not path:
+            continue
+        path_parts = path.split('/')
+        new_name = new_names.get(path_parts[-1])
+        if new_name is not None:
+            image.set('src', '/'.join(path_parts[:-1] + [new_name]))
+            changed = True
+    if changed:
+        tree.write(topic_path)
+    return changed
+
+
+def update_topic(topic_path: str, new_names: dict[str, str]) -> bool | None:
+    """
+    :return: None if the topic cannot be read, so that one broken topic does not stop the others
+    """
+    try:
+        return rename_links_in_topic(topic_path, new_names)
+    except (etree.XMLSyntaxError, OSError) as e:
+        logger.warning('Cannot update %s: %s', topic_path, e)
+        return None
+
+
+def rename_images(image_paths: list[str], topic_paths: list[str], workers: int = 1) -> tuple[int, int, list[str]]:
+    """
+    Rename all the images, then update each topic in one pass.
+    Topics without links to the images are not written.
+    :param workers: number of processes for updating the topics
+    :return: numbers of renamed images and updated topics, and the topics that could not be read
+    """
+    new_names = plan_image_names(image_paths)
+    renamed = 0
+    for path in image_paths:
+        new_name = new_names.get(os.path.basename(path))
+        if new_name is not None:
+            os.rename(path, os.path.join(os.path.dirname(path), new_name))
+            renamed += 1
+    if renamed == 0 or len(topic_paths) == 0:
+        return renamed, 0, []
+    results = None
+    if workers > 1 and len(topic_paths) > 1:
+        chunksize = max(1, len(topic_paths) // (workers * 4))
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(update_topic, topic_paths, repeat(new_names), chunksize=chunksize))
+        except (OSError, BrokenProcessPool) as e:
+            logger.warning('Parallel processing failed, updating topics one by one: ' + str(e))
+    if results is None:
+        results = [update_topic(p, new_names) for p in topic_paths]
+    failed = [p for p, result in zip(topic_paths, results) if result is None]
+    return renamed, sum(1 for result in results if result), failed
+
+
+def process_project(project_path: str, image_glob: str = default_image_glob, topic_glob: str = default_topic_glob,
+                    workers: int = 1) -> dict:
+    """
+    Rename the images of one Flare project.
+    :return: counts and timings, or the error that stopped the project
+    """
+    result = {'project': project_path, 'ok': True}
+    start = perf_counter()
+    try:
+        image_paths = find_files(project_path, image_glob)
+        topic_paths = find_files(project_path, topic_glob)
+        result['scan_seconds'] = round(perf_counter() - start, 4)
+        if not image_paths or not topic_paths:
+            raise FileNotFoundError('No %s found' % ('images' if not image_paths else 'topics'))
+        renamed, updated, failed = rename_images(image_paths, topic_paths, workers)
+        result.update({'images': renamed, 'topics': len(topic_paths), 'updated_topics': updated,
+                       'failed_topics': failed})
+        result['ok'] = not failed
+    except Exception as e:
+        logger.warning('Failed to process %s: %s', project_path, e)
+        result['ok'] = False
+        result['error'] = repr(e)
+    result['seconds'] = round(perf_counter() - start, 4)
+    return result
+
+
+def process_projects(project_paths: list[str], image_glob: str = default_image_glob,
+                     topic_glob: str = default_topic_glob, jobs: int = 1, topic_workers: int = 1,
+                     console_log_level: int = logging.WARNING) -> list[dict]:
+    """
+    :param jobs: number of projects processed at the same time, each in its own process
+    :param topic_workers: number of processes for the topics of a project, when projects are processed one by one
+    :return: results in the order of the projects
+    """
+    if jobs > 1 and len(project_paths) > 1:
+        topic_workers = 1  # the projects already use the processors
+    job = partial(process_project, image_glob=image_glob, topic_glob=topic_glob, workers=topic_workers)
+    return run_jobs(job, project_paths, jobs, lambda p, e: {'project': p, 'ok': False, 'error': repr(e)},
+                    console_log_level)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m marytreat flare-images',
+                                     description='Rename the images of Flare projects and update the topics.')
+    parser.add_argument('projects', nargs='+', help='Flare project folders')
+    parser.add_argument('--images', default=default_image_glob,
+                        help='image files, relative to the project (default: %(default)s)')
+    parser.add_argument('--topics', default=default_topic_glob,
+                        help='topic files, relative to the project (default: %(default)s)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='projects processed at the same time')
+    parser.add_argument('--topic-workers', type=int, default=os.cpu_count() or 1,
+                        help='processes for the topics of a project, when there is one project at a time')
+    parser.add_argument('--output', help='file for the JSON results (default: standard output)')
+    parser.add_argument('--verbose', action='store_true', help='print informational log messages')
+    args = parser.parse_args(argv)
+
+    project_paths = list(dict.fromkeys(os.path.abspath(p) for p in args.projects if os.path.isdir(p)))
+    if not project_paths:
+        print('No project folders found.', file=sys.stderr)
+        return 2
+    start = perf_counter()
+    results = process_projects(project_paths, args.images, args.topics, args.jobs, args.topic_workers,
+                               logging.INFO if args.verbose else logging.WARNING)
+    summary = summarize(results, start, {'projects': len(results),
+                                         'images': sum(r.get('images', 0) for r in results),
+                                         'updated_topics': sum(r.get('updated_topics', 0) for r in results)})
+    exit_code = write_summary(summary, args.output)
+    print('Processed %d projects, %d failed: %d images renamed, %d topics updated, in %.1f s'
+          % (summary['projects'], summary['failed'], summary['images'], summary['updated_topics'],
+             summary['seconds']), file=sys.stderr)
+    return exit_code
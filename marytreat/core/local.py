@@ -1,13 +1,26 @@
+import io
+import mmap
 import os
 import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from copy import deepcopy
+from functools import wraps
 from shutil import copy2
+from threading import RLock
+from typing import Iterable
 
 from lxml import etree
 
 from marytreat.core.constants import Constants
+from marytreat.core.local_files import (file_buffer, parse_buffer, find_xml_header, hash_file_contents, hash_file,
+                                        header_search_limit)
 from marytreat.core.mary_debug import logger, debugmethods
-from marytreat.core.mary_xml import XMLContent, TextElement
+from marytreat.core.mary_xml import XMLContent, TextElement, link_target, retarget_link, legal_title
+from marytreat.core.project_index import ProjectIndex, TopicFacts
+from marytreat.core.topic_scan import scan_topic
 
 prefixes: dict[str, str] = {
     # A prefix is an identifying letter that gets prepended to the filename, according to the style guide.
@@ -18,6 +31,9 @@ prefixes: dict[str, str] = {
     'legalinformation': 'e_'
 }
 
+# Image files that the map collects from its image folder
+image_extensions: tuple[str, ...] = ('png', 'jpg', 'gif')
+
 # Document type, indicated in the first content tag. Example: <task id=... outputclass="procedure">
 doctypes: list[str] = ['concept', 'task', 'reference']
 
@@ -37,6 +53,111 @@ def file_rename(old_path: str, new_path: str) -> None:
         logger.info('renamed ' + old_path + ' to ' + new_path)
 
 
+def load_xml_content(file_path: str, data: bytes | None = None) -> XMLContent:
+    """
+    Read the file from disk once. The same buffer provides the header, the parsed tree and the content hash.
+    :param data: file contents, if they have already been read
+    """
+    if data is not None:
+        return content_from_buffer(file_path, data)
+    with file_buffer(file_path) as buffer:
+        return content_from_buffer(file_path, buffer)
+
+
+def content_from_buffer(file_path: str, data: bytes | mmap.mmap) -> XMLContent:
+    try:
+        root = parse_buffer(data, file_path)
+    except Exception as e:
+        logger.error(e)
+        raise e
+    header = find_xml_header(data)
+    if header:
+        content = XMLContent(root, header)
+    else:
+        logger.debug('No XML declaration in header: %s', file_path)
+        content = XMLContent(root)
+    content.source_hash = hash_file_contents(data)
+    return content
+
+
+def get_file_state(file_path: str) -> tuple[int, int]:
+    """
+    :return: modification time and size of the file, to detect changes on disk
+    """
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_outputclass(topic_path: str, data: bytes | mmap.mmap | None = None) -> str | None:
+    """
+    Get the outputclass of a topic from its root tag, without parsing the rest of the file.
+    :param data: file contents, if they have already been read
+    """
+    if isinstance(data, bytes):
+        source = io.BytesIO(data)
+    elif data is not None:
+        data.seek(0)
+        source = data
+    else:
+        source = topic_path
+    for _, root in etree.iterparse(source, events=('start',)):
+        return root.attrib.get('outputclass')
+
+
+def normalize_image_href(href: str) -> str:
+    """
+    :param href: image href, ex. ./media\\image1.png
+    :return: href with forward slashes and without the leading ./, ex. media/image1.png
+    """
+    href = href.replace('\\', '/')
+    while href.startswith('./'):
+        href = href[2:]
+    return href
+
+
+def preload_topic_file(topic_path: str) -> tuple[str | None, str | None]:
+    """
+    Runs in a worker process during parallel lazy map loading.
+    Reads the outputclass from the root tag of the topic and, only if there is none, parses the topic to detect its type.
+    Only the type is sent back, so that the main process does not parse the topic until its content is used.
+    :return: outputclass and detected type, both None if the file cannot be parsed
+    """
+    try:
+        with file_buffer(topic_path) as buffer:
+            oc = read_outputclass(topic_path, buffer)
+            if oc is not None:
+                return oc, None
+            return None, XMLContent(parse_buffer(buffer, topic_path)).detect_type()
+    except (etree.XMLSyntaxError, OSError):
+        return None, None  # reported when the main process parses the file
+
+
+def batched_writes(method):
+    """
+    Run a LocalMap method inside LocalMap.write_behind(), or LocalWorkspace.write_behind() for a map in a workspace.
+    The map is locked meanwhile, so that changes on disk are not applied in the middle of an operation.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        writes = self.workspace.write_behind() if self.workspace is not None else self.write_behind()
+        with self.lock, writes:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def synchronized(method):
+    """
+    Run a LocalMap method while holding the map lock.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
 def file_delete(path: str) -> None:
     if not os.path.exists(path):
         logger.error('No file to delete: ' + path)
@@ -46,25 +167,80 @@ def file_delete(path: str) -> None:
 
 class LocalProjectFile:
 
-    def __init__(self, file_path: str) -> None:
+    def __init__(self, file_path: str, content: XMLContent | None = None, lazy: bool = False) -> None:
         """
         Based on file path, retrieve the containing folder and parse the file in advance.
+        If the file has already been parsed, pass its content to avoid reading it again.
+        If lazy, the file is parsed the first time its content is accessed.
         """
         self.path = file_path
         self.folder, self.name = os.path.split(self.path)
         self.basename, self.ext = os.path.splitext(self.name)
         self.ditamap: LocalMap | None = None  # is assigned during map initialization
 
+        self.file_state: tuple[int, int] | None = None
+        if content is None and not lazy:
+            content = load_xml_content(self.path)
+        self._content: XMLContent | None = content
+        if content is not None:
+            self.file_state = get_file_state(self.path)
+
+    def set_path(self, new_path: str) -> None:
+        """
+        Follow the file to a new path, without renaming anything.
+        """
+        self.path = new_path
+        self.folder, self.name = os.path.split(self.path)
+        self.basename, self.ext = os.path.splitext(self.name)
+
+    @property
+    def content(self) -> XMLContent:
+        if self._content is None:
+            logger.debug('Loading content of %s', self.name)
+            self._content = load_xml_content(self.path)
+            self.file_state = get_file_state(self.path)
+            self.on_content_loaded()
+        return self._content
+
+    @content.setter
+    def content(self, new_content: XMLContent) -> None:
+        self._content = new_content
+
+    @property
+    def content_loaded(self) -> bool:
+        return self._content is not None
+
+    def on_content_loaded(self) -> None:
+        """
+        Override to prepare the content of a lazily loaded or reloaded file.
+        """
+        pass
+
+    def file_changed(self, check_hash: bool = False) -> bool:
+        """
+        Compare the modification time and size of the file with the ones it had when it was loaded or written.
+        :param check_hash: if the time or size differ, compare the contents as well, to skip files that were only touched
+        """
         try:
-            root = etree.parse(self.path).getroot()
-        except Exception as e:
-            logger.error(e)
-            raise(e)
-        header = self.get_xml_file_header()
-        if header:
-            self.content = XMLContent(root, header)
-        else:
-            self.content = XMLContent(root)
+            state = get_file_state(self.path)
+        except FileNotFoundError:
+            return True
+        if state == self.file_state:
+            return False
+        if check_hash and self._content is not None and self._content.source_hash is not None:
+            if hash_file(self.path) == self._content.source_hash:
+                self.file_state = state
+                return False
+        return True
+
+    def reload(self) -> None:
+        """
+        Parse the file again after it has been changed on disk.
+        """
+        logger.info('Reloading %s', self.name)
+        self._content = load_xml_content(self.path)
+        self.file_state = get_file_state(self.path)
+        self.on_content_loaded()
 
     def __repr__(self) -> str:
         return '<LocalProjectFile: ' + self.name + self.ext + '>'
@@ -97,28 +273,40 @@ class LocalProjectFile:
         if not self.path:
             logger.error('Path', self.path, 'does not exist')
             raise FileNotFoundError
-        with open(self.path, 'r', encoding='utf-8') as f:
-            declaration = r'(<\?xml version="1.0" encoding="UTF-8"\?>\n)(<!DOCTYPE.*?>\n)?'
-            first_four_lines = ''
-            for i in range(4):  # get the first 4 lines of the file
-                first_four_lines += str(next(f))
-            # look for xml declaration or xml declaration followed by doctype declaration
-            found_declaration = re.findall(declaration, first_four_lines, re.DOTALL)
-            if len(found_declaration) > 0:
-                header = ''.join(found_declaration[0])
-                return header
-            else:
-                logger.debug('No XML declaration in header: ' + str(self))
-                return
+        with open(self.path, 'rb') as f:
+            header = find_xml_header(b''.join(f.readline(header_search_limit) for i in range(4)))
+        if header is None:
+            logger.debug('No XML declaration in header: %s', self)
+        return header
 
     def write(self, *args, **kwargs) -> None:
         """
         Call this after all manipulations with the tree.
+        Inside LocalMap.write_behind(), the file is written once, when the whole operation is over.
         """
-        self.content.tree.write(self.path, xml_declaration=True, encoding='utf-8', doctype=self.content.doctype, *args,
-                                **kwargs)
+        if self.ditamap is not None and self.ditamap.pending_writes is not None:
+            self.ditamap.pending_writes[id(self)] = (self, args, kwargs)
+            return
+        self.write_now(*args, **kwargs)
         # self.write_header()
 
+    def write_now(self, *args, **kwargs) -> bool:
+        """
+        Write the tree to disk, unless the output is byte-identical to the file as it was loaded or last written.
+        :return: True if the file has been written
+        """
+        data = etree.tostring(self.content.tree, xml_declaration=True, encoding='UTF-8',
+                              doctype=self.content.doctype, *args, **kwargs)
+        data_hash = hash_file_contents(data)
+        if data_hash == self.content.source_hash and not self.file_changed():
+            logger.debug('Not changed, skipped writing: %s', self.name)
+            return False
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        self.file_state = get_file_state(self.path)
+        self.content.source_hash = data_hash
+        return True
+
     def write_header(self):
         with open(self.path, 'r+') as f:
             file_contents = f.read()
@@ -129,8 +317,24 @@ class LocalProjectFile:
 @debugmethods
 class LocalMap(LocalProjectFile):
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, workers: int = 0, lazy: bool = False, use_index: bool = False, workspace=None):
+        """
+        :param workers: number of worker processes for classifying topics when they are loaded lazily.
+        By default, topics are classified one after another in this process.
+        :param lazy: create topics from their topicrefs and outputclasses only,
+        and parse each topic the first time its content is accessed.
+        :param use_index: keep topic facts in a project index next to the map.
+        Topics that have not changed since they were indexed are not parsed until their content is accessed.
+        :param workspace: LocalWorkspace that the map shares its topics, images, link index and lock with
+        """
+        self.pending_writes: dict[int, tuple[LocalProjectFile, tuple, dict]] | None = None
+        self.workspace = workspace
+        # taken by operations and by updates from a MapWatcher
+        self.lock = workspace.lock if workspace is not None else RLock()
         super().__init__(file_path)
+        self.workers = workers
+        self.lazy = lazy
+        self.index: ProjectIndex | None = self.open_index() if use_index else None
         self.source = self.check_project_folder_content()
         self.image_folder = self.folder
         if self.source == 'word':
@@ -142,10 +346,24 @@ class LocalMap(LocalProjectFile):
         self.images = self.get_images()
         self.ditamap = self
         self.topics = self.get_topics()
+        # the link index of a workspace covers all its maps, and is built once they are loaded
+        self._link_index = None if self.lazy or self.index or workspace else self.get_link_index()
+        if self.index is not None:
+            self.update_index()
 
     def __str__(self) -> str:
         return '<LocalMap: ' + self.name + '>'
 
+    def open_index(self) -> ProjectIndex | None:
+        """
+        :return: the project index, or None if it cannot be used, ex. in a read-only or locked folder
+        """
+        try:
+            return ProjectIndex(self.path)
+        except (sqlite3.Error, OSError) as e:
+            logger.warning('Cannot use the project index, loading the map without it: ' + str(e))
+            return None
+
     def __repr__(self):
         return '<LocalMap: ' + self.name + '>'
 
@@ -153,12 +371,12 @@ class LocalMap(LocalProjectFile):
         return True if item in self.topics else False
 
     oc_object_types: dict[str, str] = {
-        'referenceinformation': 'LocalReferenceInformationTopic(topic_path, self)',
-        'procedure': 'LocalTaskTopic(topic_path, self)',
-        'legalinformation': 'LocalLegalInformationTopic(topic_path, self)',
-        'context': 'LocalConceptTopic(topic_path, self)',
-        'lpcontext': 'LocalConceptTopic(topic_path, self)',
-        'explanation': 'LocalTopic(topic_path, self)'
+        'referenceinformation': 'LocalReferenceInformationTopic(topic_path, self, topic_content, lazy)',
+        'procedure': 'LocalTaskTopic(topic_path, self, topic_content, lazy)',
+        'legalinformation': 'LocalLegalInformationTopic(topic_path, self, topic_content, lazy)',
+        'context': 'LocalConceptTopic(topic_path, self, topic_content, lazy)',
+        'lpcontext': 'LocalConceptTopic(topic_path, self, topic_content, lazy)',
+        'explanation': 'LocalTopic(topic_path, self, topic_content, lazy)'
     }
 
     def check_project_folder_content(self):
@@ -215,6 +433,27 @@ class LocalMap(LocalProjectFile):
                 content_types[ext].append(basename)
         return content_types
 
+    @property
+    def images(self) -> set['Image']:
+        return self._images
+
+    @images.setter
+    def images(self, new_images: set['Image']) -> None:
+        if self.workspace is not None:
+            new_images = self.workspace.share_images(new_images)
+        self._images = new_images
+        self.image_registry: dict[str, Image] = {normalize_image_href(img.href): img for img in new_images}
+
+    def find_image(self, href: str) -> 'Image | None':
+        """
+        Look up a map image by the href used in a topic, or by its file name for images in the map folder.
+        """
+        href = normalize_image_href(href)
+        image = self.image_registry.get(href)
+        if image is None:
+            image = self.image_registry.get(href.rsplit('/', 1)[-1])
+        return image
+
     def get_images(self) -> set['Image']:
         """
         Run this before get_topics, because topics
@@ -222,7 +461,7 @@ class LocalMap(LocalProjectFile):
         """
         image_list = []
         for file in os.listdir(self.image_folder):
-            if file.endswith(('png', 'jpg', 'gif')):
+            if file.endswith(image_extensions):
                 if self.folder != self.image_folder:
                     href = os.path.basename(self.image_folder) + '/' + file
                 else:
@@ -230,57 +469,368 @@ class LocalMap(LocalProjectFile):
                 image_list.append(Image(href, self))
         return set(image_list)
 
-    def get_topic_from_topicref(self, topicref: etree.Element):
+    def get_topic_from_topicref(self, topicref: etree.Element, loaded: dict[str, 'LocalTopic'] | None = None,
+                                preloaded: dict[str, tuple[str | None, str | None]] | None = None,
+                                reused: dict[str, XMLContent] | None = None):
+        """
+        :param loaded: topics that have already been created during this pass, by path.
+        A topic that is nested in a context topic is created together with its parent,
+        and gets reused when the map iteration reaches it.
+        :param preloaded: outputclasses and detected types from the worker processes, by path
+        :param reused: contents of unchanged topics that do not have to be parsed again, by path
+        """
         topic_path: str = os.path.join(self.folder, topicref.attrib.get('href'))
-        try:
-            topic_content = XMLContent(etree.parse(topic_path).getroot())
-        except Exception as e:
-            logger.error(e)
-            raise e
-        oc: str = topic_content.root.attrib.get('outputclass')
+        if loaded is not None and topic_path in loaded:
+            return loaded[topic_path]
+        preloaded_types = preloaded.pop(topic_path, None) if preloaded is not None else None
+        detected_type: str | None = None
+        oc: str | None = None
+        topic_content: XMLContent | None = None
+        lazy = False
+        facts: TopicFacts | None = None
+        reused_content = reused.pop(topic_path, None) if reused is not None else None
+        if self.index is not None and reused_content is None:
+            facts = self.index.get_fresh(topic_path, get_file_state(topic_path), lambda: hash_file(topic_path))
+            if facts is not None and facts.outputclass is not None:
+                oc = facts.outputclass
+                lazy = True
+        if self.lazy and not lazy and reused_content is None:
+            if preloaded_types is not None:
+                oc, detected_type = preloaded_types
+                lazy = oc is not None or detected_type is not None
+            else:
+                # topics without an outputclass have to be parsed anyway to detect their type:
+                # the file is read once, and the root tag is only probed if the file mentions an outputclass at all,
+                # which topics converted from Word do not
+                with file_buffer(topic_path) as buffer:
+                    if buffer.find(b'outputclass') >= 0:
+                        oc = read_outputclass(topic_path, buffer)
+                    if oc is None:
+                        topic_content = content_from_buffer(topic_path, buffer)
+                lazy = oc is not None
+        if lazy:
+            topic_content = None
+        elif reused_content is not None:
+            topic_content = reused_content
+            oc = topic_content.root.attrib.get('outputclass')
+        elif topic_content is None:
+            topic_content = load_xml_content(topic_path)
+            oc = topic_content.root.attrib.get('outputclass')
         children = topicref.findall('topicref')
         if oc is None:
             if len(children) > 0:
                 oc = 'context'
             else:
-                oc = topic_content.detect_type()
+                oc = detected_type or topic_content.detect_type()
         if oc in self.oc_object_types.keys():
             topic = eval(self.oc_object_types[oc])
             if oc == 'context' or oc == 'lpcontext':
-                topic.children = [self.get_topic_from_topicref(child) for child in children]
+                topic.children = [self.get_topic_from_topicref(child, loaded, preloaded, reused) for child in children]
         else:
-            topic = LocalTopic(topic_path, self)
-        topic.content.set_outputclass(oc)
+            topic = LocalTopic(topic_path, self, topic_content, lazy)
+        topic.assigned_outputclass = oc
+        if topic.content_loaded:
+            topic.content.set_outputclass(oc)
+        elif facts is not None:
+            topic.facts = facts
 
         if self.source == 'cheetah':
-            topic_path: str = os.path.join(self.folder, topicref.attrib.get('href'))
             ish_path = topic_path.replace('.dita', '.3sish')
-            topic.ish = LocalISHFile(ish_path, self)
+            topic.ish = LocalISHFile(ish_path, self, lazy)
+        if loaded is not None:
+            loaded[topic_path] = topic
         return topic
 
-    def get_topics(self) -> list['LocalTopic']:
+    def get_topics(self, reused: dict[str, XMLContent] | None = None) -> list['LocalTopic']:
+        """
+        :param reused: contents of unchanged topics that do not have to be parsed again, by path
+        """
         topics = []
+        listed: set[str] = set()
+        # topics referenced by several maps of a workspace are created once
+        loaded: dict[str, LocalTopic] = self.workspace.topics_by_path if self.workspace is not None else {}
+        # an eager map parses every topic in this process anyway, so only a lazy map classifies its topics in workers
+        preloaded = self.preload_topics() if self.workers > 1 and self.lazy and reused is None else None
         for topicref in self.content.root.iter('topicref'):
-            logger.info('Initializing ' + topicref.attrib.get('href') + '...')
-            topic = self.get_topic_from_topicref(topicref)
-            topics.append(topic)
+            logger.info('Initializing %s...', topicref.attrib.get('href'))
+            topic = self.get_topic_from_topicref(topicref, loaded, preloaded, reused)
+            if topic.path not in listed:  # a file referenced twice in the map is still one topic
+                listed.add(topic.path)
+                topics.append(topic)
         return topics
 
+    def preload_topics(self) -> dict[str, tuple[str | None, str | None]] | None:
+        """
+        Classify all the map topics in a pool of worker processes.
+        The topic objects are then assembled in map order in this process, and parsed when they are used.
+        """
+        topic_paths = list(dict.fromkeys(os.path.join(self.folder, topicref.attrib.get('href'))
+                                         for topicref in self.content.root.iter('topicref')))
+        if self.workspace is not None:
+            topic_paths = [p for p in topic_paths if p not in self.workspace.topics_by_path]
+        logger.info('Preloading %d topics in %d processes...', len(topic_paths), self.workers)
+        chunksize = max(1, len(topic_paths) // (self.workers * 4))
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                return dict(zip(topic_paths, pool.map(preload_topic_file, topic_paths, chunksize=chunksize)))
+        except (OSError, BrokenProcessPool) as e:
+            logger.warning('Parallel loading failed, loading topics one by one: ' + str(e))
+            return None
+
+    @property
+    def link_index(self) -> dict[str, list[tuple['LocalTopic', etree.Element]]]:
+        if self._link_index is None:
+            if self.workspace is not None:
+                return self.workspace.share_link_index()
+            self._link_index = self.get_link_index()
+        return self._link_index
+
+    def get_link_index(self, topics: Iterable['LocalTopic'] | None = None
+                       ) -> dict[str, list[tuple['LocalTopic', etree.Element]]]:
+        """
+        Reverse index of local links: linked file name -> topics and xref elements that link to it.
+        :param topics: topics to index, the map topics by default
+        """
+        link_index: dict[str, list[tuple[LocalTopic, etree.Element]]] = {}
+        for topic in (self.topics if topics is None else topics):
+            if not topic.content_loaded and topic.facts is not None and topic.facts.local_links == []:
+                continue  # no need to parse a topic that is known to have no links
+            self.index_topic_links(topic, link_index)
+        return link_index
+
+    def index_topic_links(self, topic: 'LocalTopic', link_index=None) -> None:
+        if link_index is None:
+            link_index = self._link_index
+            if link_index is None:  # not built yet, the topic will be indexed with the rest
+                return
+        for link in topic.content.local_links:
+            href = link.attrib.get('href')
+            if href:
+                link_index.setdefault(link_target(href), []).append((topic, link))
+
+    def update_index(self) -> None:
+        """
+        Save facts about the parsed topics to the project index, and forget the topics that left the map.
+        """
+        for topic in self.topics:
+            if topic.content_loaded and topic.facts is None:
+                topic.facts = TopicFacts.from_content(topic.path, topic.content, topic.file_state)
+                self.index.put(topic.facts)
+        self.index.prune({t.path for t in self.topics})
+        self.index.commit()
+
+    def unindex_topic_links(self, topic: 'LocalTopic') -> None:
+        """
+        Remove the links of a topic from the link index, before the topic is reloaded.
+        """
+        if self._link_index is None:
+            return
+        for link in topic.content.local_links:
+            href = link.attrib.get('href')
+            entries = self._link_index.get(link_target(href)) if href else None
+            if entries:
+                entries[:] = [(t, l) for t, l in entries if l is not link]
+
+    @contextmanager
+    def write_behind(self):
+        """
+        Collect the writes of the map, its topics and ISH files during an operation,
+        and write each changed file once at the end.
+        """
+        if self.pending_writes is not None:  # already inside an operation
+            yield
+            return
+        self.pending_writes = {}
+        try:
+            yield
+        finally:
+            pending, self.pending_writes = self.pending_writes, None
+            written = sum(1 for file, args, kwargs in pending.values() if file.write_now(*args, **kwargs))
+            if written and self.index is not None:
+                self.index.commit()
+            logger.debug('Wrote %d of %d files', written, len(pending))
+
+    @batched_writes
     def cast_topics_from_word(self):
         for topic in self.topics:
             topic.cast_from_word()
 
-    def refresh(self) -> tuple[set['Image'], list['LocalTopic']]:
-        return self.get_images(), self.get_topics()
+    @synchronized
+    def refresh(self, check_hash: bool = False) -> tuple[set['Image'], list['LocalTopic']]:
+        """
+        Bring the map up to date with the files on disk. Only changed, added or removed files are parsed again.
+        :param check_hash: compare the contents of files whose modification time or size has changed,
+        and skip the ones that are actually the same
+        """
+        images_changed = self.refresh_images()
+        changed_topics = [t for t in self.topics if t.content_loaded and t.file_changed(check_hash)]
+        for topic in self.topics:
+            if not topic.content_loaded:
+                topic._summary = None  # scanned again on demand
+        map_changed = self.file_changed(check_hash)
+        if map_changed and self.workspace is not None:
+            # the topics are shared with the other maps: update them in place, then rebuild the topic list
+            for topic in changed_topics:
+                self.reload_topic(topic)
+            self.reload()
+            self.topics = self.get_topics()
+            self.workspace.reset_link_index()
+            if self.index is not None:
+                self.update_index()
+            return self.images, self.topics
+        if map_changed:
+            # topics may have been added, removed or moved: rebuild the topic list,
+            # reusing the contents of the topics that have not changed
+            changed_paths = {t.path for t in changed_topics}
+            reused = {t.path: t.content for t in self.topics if t.content_loaded and t.path not in changed_paths}
+            self.reload()
+            self.topics = self.get_topics(reused)
+            self._link_index = None if self.lazy or self.index else self.get_link_index()
+            if self.index is not None:
+                self.update_index()
+            return self.images, self.topics
+
+        for topic in changed_topics:
+            self.reload_topic(topic)
+        if images_changed:
+            for topic in self.topics:
+                if topic.content_loaded and topic not in changed_topics:
+                    topic.images = topic.get_images()
+        if self.index is not None and len(changed_topics) > 0:
+            self.update_index()
+        return self.images, self.topics
+
+    @synchronized
+    def apply_file_changes(self, paths: Iterable[str], check_hash: bool = True,
+                           moves: dict[str, str] | None = None) -> list['LocalTopic']:
+        """
+        Update the map after files have been created, modified, renamed or deleted on disk,
+        for example, as reported by a MapWatcher. Only the topics and images at these paths are updated.
+        Files that the map has written itself are recognized as unchanged.
+        :param check_hash: skip files whose contents are the same, although the time or size differ
+        :param moves: old path -> new path of renamed files, if they are known
+        :return: topics that were reloaded, renamed, or that will be scanned again
+        """
+        paths = {os.path.abspath(p) for p in paths}
+        if os.path.abspath(self.path) in paths:
+            if self.file_changed(check_hash):
+                _, topics = self.refresh(check_hash)  # the topics are taken from the new topicrefs
+                return list(topics)
+        changed_topics = self.apply_topic_moves(moves) if moves else []
+        image_folder = os.path.abspath(self.image_folder)
+        images_changed = False
+        if any(os.path.dirname(p) == image_folder and p.endswith(image_extensions) for p in paths):
+            images_changed = self.refresh_images()
+        for topic in self.topics:
+            if os.path.abspath(topic.path) not in paths:
+                continue
+            if topic in changed_topics:
+                continue
+            if topic.content_loaded:
+                if not topic.file_changed(check_hash):
+                    continue
+                self.reload_topic(topic)
+            else:
+                topic.facts = None
+                topic._summary = None
+                if self._link_index is not None:
+                    # the topic was left out of the link index, but may have links now
+                    self.index_topic_links(topic)
+            changed_topics.append(topic)
+        if images_changed:
+            for topic in self.topics:
+                if topic.content_loaded and topic not in changed_topics:
+                    topic.images = topic.get_images()
+        if self.index is not None and len(changed_topics) > 0:
+            self.update_index()
+        return changed_topics
+
+    def apply_topic_moves(self, moves: dict[str, str]) -> list['LocalTopic']:
+        """
+        Let the topics follow their files that were renamed on disk, and update the topicrefs to them
+        in every map of the workspace. Links in other topics are left as they are on disk.
+        A move is ignored if a file is back at the old path, ex. when an editor keeps a backup while saving.
+        :param moves: old path -> new path
+        :return: topics that were moved
+        """
+        topics_by_path = {os.path.abspath(t.path): t for m in self.related_maps for t in m.topics}
+        moved = []
+        for old_path, new_path in moves.items():
+            topic = topics_by_path.get(os.path.abspath(old_path))
+            if topic is None or os.path.exists(old_path) or os.path.splitext(new_path)[1] != topic.ext:
+                continue
+            logger.info('Renamed on disk: %s to %s', old_path, new_path)
+            changed_maps = []
+            for m in self.related_maps:
+                old_href = os.path.relpath(old_path, m.folder).replace('\\', '/')
+                new_href = os.path.relpath(new_path, m.folder).replace('\\', '/')
+                if m.update_topicrefs({old_href: new_href}):
+                    changed_maps.append(m)
+            previous_path = topic.path
+            topic.set_path(os.path.join(self.folder, os.path.relpath(new_path, self.folder)))
+            if self.workspace is not None:
+                self.workspace.topics_by_path[topic.path] = self.workspace.topics_by_path.pop(previous_path, topic)
+            for m in changed_maps:
+                m.write()
+            moved.append(topic)
+        return moved
+
+    def reload_topic(self, topic: 'LocalTopic') -> None:
+        """
+        Parse a topic that has been changed on disk again, and update the link index.
+        """
+        if not os.path.exists(topic.path):
+            logger.warning('Topic file is missing: ' + topic.path)
+            return
+        self.unindex_topic_links(topic)
+        topic.reload()
+        self.index_topic_links(topic)
 
-    def rename_topics(self) -> int:
+    def refresh_images(self) -> bool:
+        """
+        Update the map set of images with files that were added to or removed from the image folder.
+        Images that are still there keep their objects and titles.
+        :return: True if the set of images has changed
+        """
+        current: dict[str, Image] = {img.href: img for img in self.images}
+        listed: dict[str, Image] = {img.href: img for img in self.get_images()}
+        if current.keys() == listed.keys():
+            return False
+        self.images = {current.get(href, img) for href, img in listed.items()}
+        return True
+
+    @batched_writes
+    def rename_topics(self, topics: Iterable['LocalTopic'] | None = None) -> int:
         """
         Rename files in map folder according to their titles and the style guide.
         Tracks repeating topic titles.
+        The complete rename plan is computed first, then applied in a single batch.
+        :param topics: topics to rename, the map topics by default
+        """
+        renames, considered = self.plan_topic_renames(topics)
+        renamed = {topic.path for topic, _, _ in renames}
+        for topic in considered:
+            if isinstance(topic, LocalLegalInformationTopic):
+                topic.content.add_legal_title_and_shortdesc()  # the planned name is based on the standard title
+                if topic.path not in renamed:
+                    topic.write()
+        self.apply_topic_renames([(topic, new_name) for topic, new_name, _ in renames])
+        return len(considered)
+
+    def plan_topic_renames(self, topics: Iterable['LocalTopic'] | None = None
+                           ) -> tuple[list[tuple['LocalTopic', str, int]], list['LocalTopic']]:
+        """
+        Work out the new file names of topics without renaming, writing or changing anything.
+        The names of legal information topics are based on the standard title that the rename gives them.
+        :param topics: topics to rename, the map topics by default
+        :return: topics to rename with their new file names and the numbers of their titles among repeating ones;
+        all the topics that were considered
         """
-        renamed_files_counter = 0
         topic_title_repetitions: dict[str, int] = {}
-        for topic in self.topics:
+        renames: list[tuple[LocalTopic, str, int]] = []
+        considered: list[LocalTopic] = []
+        claimed_names: set[str] = set()
+        for topic in (self.topics if topics is None else topics):
             if topic.content.root.tag in doctypes:
                 title_text = topic.content.title_tag.text
                 if title_text in topic_title_repetitions:
@@ -288,10 +838,69 @@ class LocalMap(LocalProjectFile):
                 else:
                     topic_title_repetitions[title_text] = 1
                 num_rep = topic_title_repetitions[title_text]
-                topic.update_name(num_rep)
-                renamed_files_counter += 1
-        logger.debug('Repeated topic titles:', {k: v for k, v in topic_title_repetitions.items() if v > 0})
-        return renamed_files_counter
+                new_name = topic.plan_new_name(num_rep)
+                if new_name is None:
+                    pass
+                elif new_name in claimed_names:
+                    logger.warning('Skipped: %s, another topic is already renamed to %s' % (topic.name, new_name))
+                else:
+                    claimed_names.add(new_name)
+                    renames.append((topic, new_name, num_rep))
+                considered.append(topic)
+        logger.debug('Repeated topic titles: ' + str({k: v for k, v in topic_title_repetitions.items() if v > 1}))
+        return renames, considered
+
+    def apply_topic_renames(self, renames: list[tuple['LocalTopic', str]]) -> int:
+        """
+        Rename topic files and update all the links and topicrefs to them, in every map of the workspace.
+        The files are renamed first, so that links are only retargeted to files that exist;
+        a topic that cannot be renamed keeps its name and its links. Each touched file is then written once.
+        :param renames: pairs of topic and its new file name (ex. r_Printing_instructions.dita)
+        :return: number of renamed topics
+        """
+        new_names: dict[str, str] = {}
+        touched: dict[str, LocalTopic] = {}
+        for topic, new_name in renames:
+            old_name, old_path = topic.name, topic.path
+            new_basename = os.path.splitext(new_name)[0]
+            try:
+                topic.rename_path(old_path, new_basename)
+            except OSError as e:
+                logger.warning('Skipped: %s, cannot rename: %s' % (old_name, e))
+                continue
+            new_names[old_name] = new_name
+            touched[topic.path] = topic
+            if self.workspace is not None:
+                self.workspace.topics_by_path[topic.path] = self.workspace.topics_by_path.pop(old_path, topic)
+            if topic.ish is not None:
+                topic.ish.rename_with_path(topic.ish.path, new_basename)
+        if len(new_names) == 0:
+            return 0
+
+        # Take out all the affected index entries before putting them back,
+        # so that a link is never retargeted twice when one new name equals another old name
+        retargeted = [(new_names[old_name], self.link_index.pop(old_name))
+                      for old_name in new_names if old_name in self.link_index]
+        for new_name, links in retargeted:
+            for t, link in links:
+                logger.info("'%s' has old link to %s (%s)", t.content.title_tag.text, new_name, link.attrib.get('href'))
+                link.set('href', retarget_link(link.attrib.get('href'), new_name))
+                touched[t.path] = t
+            self.link_index.setdefault(new_name, []).extend(links)
+        changed_maps = [m for m in self.related_maps if m.update_topicrefs(new_names)]
+
+        for t in touched.values():
+            t.write()
+        for m in changed_maps:
+            m.write()
+        return len(new_names)
+
+    @property
+    def related_maps(self) -> list['LocalMap']:
+        """
+        The maps that share topics with this one: all the maps of its workspace, or only this map.
+        """
+        return self.workspace.maps if self.workspace is not None else [self]
 
     def update_topicref(self, old, new):
         for topicref in self.content.root.iter('topicref'):
@@ -302,9 +911,25 @@ class LocalMap(LocalProjectFile):
                 topicref.set('href', new)
         self.write()
 
-    def mass_edit(self) -> list[str]:
+    def update_topicrefs(self, new_names: dict[str, str]) -> bool:
+        """
+        Update several topicrefs in one pass, without writing the map.
+        :param new_names: old topic file name -> new topic file name
+        :return: True if the map has changed
+        """
+        changed = False
+        for topicref in self.content.root.iter('topicref'):
+            new = new_names.get(topicref.attrib.get('href'))
+            if new is not None:
+                topicref.set('href', new)
+                changed = True
+        return changed
+
+    @batched_writes
+    def mass_edit(self, topics: Iterable['LocalTopic'] | None = None) -> list[str]:
         """
         Mass edit short descriptions for typical documents. Returns a list of processed files.
+        :param topics: topics to edit, the map topics by default
         """
         shortdescs: dict[str, str] = {
             'Revision history and confidentiality notice':
@@ -315,7 +940,7 @@ class LocalMap(LocalProjectFile):
         }
 
         processed_files: list[str] = []
-        for topic in self.topics:
+        for topic in (self.topics if topics is None else topics):
             content = topic.content
             if isinstance(topic, LocalReferenceInformationTopic):
                 content.process_docdetails()
@@ -330,19 +955,41 @@ class LocalMap(LocalProjectFile):
         return processed_files
 
     def get_problematic_files(self):
-        pfiles = [t for t in self.topics if
-                  t.content.shortdesc_missing() or t.content.title_missing()
-                  or t.content.has_draft_comments]
+        pfiles = [t for t in self.topics if t.is_problematic()]
         return sorted(pfiles)
 
-    def edit_image_names(self, image_prefix: str) -> None:
+    @batched_writes
+    def edit_image_names(self, image_prefix: str, topics: Iterable['LocalTopic'] | None = None) -> int:
+        """
+        Rename the images used in topics according to their titles, and update the hrefs.
+        The complete rename plan is computed first. Then each topic is rewritten in one pass over its images
+        and written once, and the image files are renamed in one batch.
+        :param topics: topics whose images are renamed, the map topics by default
+        :return: number of renamed images
+        """
+        return self.apply_image_renames(self.plan_image_renames(image_prefix, topics))
+
+    def plan_image_renames(self, image_prefix: str, topics: Iterable['LocalTopic'] | None = None
+                           ) -> list[tuple['Image', str]]:
+        """
+        Work out the new names of the images used in topics, without renaming anything.
+        :param topics: topics whose images are renamed, the map topics by default
+        :return: images with their new hrefs
+        """
         # there can be two images with different paths but identical titles
         # one image can be reference in multiple topics
-        # count repeating titles and get image to topic map for purposes of renaming
+        # count repeating titles for purposes of renaming
+        topics = list(self.topics if topics is None else topics)
+        for topic in topics:
+            # the figures of a topic set the titles of its images: take them again in map order before counting,
+            # so that lazy maps and maps restored from the index get the same names as eager maps,
+            # whatever order their topics were parsed in
+            topic.images = topic.get_images()
         titles: dict[str, int] = {}
-        image_uses_in_topic: dict[Image, list[LocalTopic]] = {}
-        for topic in self.topics:
-            for image in topic.images:
+        used_images: dict[Image, None] = {}
+        for topic in topics:
+            # the images of a topic are a set: number them in a stable order
+            for image in sorted(topic.images, key=lambda img: img.href):
                 if not image.title:
                     pass
                 elif image.title in titles:
@@ -351,34 +998,99 @@ class LocalMap(LocalProjectFile):
                 else:
                     titles[image.title] = 1
                     image.temp_title = image.title
-                topics = image_uses_in_topic.setdefault(image, [])
-                topics.append(topic)
-        # give image files new names
-        for img, topics in image_uses_in_topic.items():
+                used_images[image] = None
+        renames: list[tuple[Image, str]] = []
+        claimed_paths: set[str] = set()
+        for img in used_images:
             new_name: str = img.generate_name(image_prefix)
             current_path: str = os.path.join(self.folder, img.href)
             new_path: str = os.path.join(self.image_folder, new_name)
-            logger.debug('Renaming ' + current_path + ' to ' + new_path)
             if current_path == new_path:
-                logger.debug('Image already renamed: ' + current_path)
+                logger.debug('Image already renamed: %s', current_path)
                 continue
             if not os.path.exists(current_path):
                 logger.warning('Image file to rename not found, skipping: ' + current_path)
                 continue
-            if os.path.exists(new_path):
+            if os.path.exists(new_path) or new_path in claimed_paths:
                 logger.warning('File with the new name "' + new_path + '" already exists, skipping')
                 continue
-            file_rename(current_path, new_path)
-            # rename hrefs in topics
+            claimed_paths.add(new_path)
             if self.image_folder != self.folder:
                 new_name = os.path.basename(self.image_folder) + '/' + new_name
-            for topic in topics:
+            renames.append((img, new_name))
+        return renames
+
+    def apply_image_renames(self, renames: list[tuple['Image', str]]) -> int:
+        """
+        Rename image files and update the image hrefs in all the topics that use them, in every map of the workspace.
+        :param renames: pairs of image and its new href (ex. media/img_guide_Front_panel.png)
+        :return: number of renamed images
+        """
+        new_hrefs: dict[Image, str] = {}
+        for img, new_href in renames:
+            current_path = os.path.join(self.folder, img.href)
+            new_path = os.path.join(self.folder, new_href)
+            if not os.path.exists(current_path) or os.path.exists(new_path):
+                logger.warning('Cannot rename %s to %s, skipping', current_path, new_path)
+                continue
+            new_hrefs[img] = new_href
+        if len(new_hrefs) == 0:
+            return 0
+        # rename hrefs in topics, one pass over the images of each topic
+        renamed = new_hrefs.keys()
+        for m in self.related_maps:
+            for topic in m.topics:
+                facts = topic.facts if not topic.content_loaded else None
+                if facts is not None and facts.image_hrefs is not None and \
+                        not any(topic.ditamap.find_image(href) in new_hrefs for href in facts.image_hrefs):
+                    continue  # no need to parse a topic that is known not to use the images
+                if renamed.isdisjoint(topic.images):
+                    continue
                 for img_tag in topic.content.root.iter('image'):
-                    if img_tag.attrib.get('href') != img.href:
-                        continue
-                    logger.info('Renaming ' + img.href + ' to ' + new_name)
-                    img_tag.set('href', new_name)
+                    img = topic.ditamap.find_image(img_tag.attrib.get('href', ''))
+                    if img in new_hrefs:
+                        logger.info('Renaming %s to %s', img_tag.attrib.get('href'), new_hrefs[img])
+                        img_tag.set('href', new_hrefs[img])
                 topic.write()
+        for img, new_href in new_hrefs.items():
+            file_rename(os.path.join(self.folder, img.href), os.path.join(self.folder, new_href))
+        # the images keep their objects and titles under the new names
+        for img, new_href in new_hrefs.items():
+            img.href = new_href
+        for m in self.related_maps:
+            m.images = m.images
+        return len(new_hrefs)
+
+    @batched_writes
+    def apply_rename_plan(self, plan) -> tuple[int, int]:
+        """
+        Apply a RenamePlan that was computed earlier, ex. read from a file after a review.
+        The new names are taken from the plan as they are. Links and topicrefs are updated like in rename_topics.
+        Renames that no longer fit the files on disk are skipped.
+        :return: numbers of renamed topics and images
+        """
+        topics_by_name: dict[str, LocalTopic] = {t.name: t for m in self.related_maps for t in m.topics}
+        topic_renames: list[tuple[LocalTopic, str]] = []
+        for old_name, new_name in plan.topic_renames():
+            topic = topics_by_name.get(old_name)
+            if topic is None:
+                logger.warning('Topic from the rename plan is not in the map, skipping: ' + old_name)
+                continue
+            if os.path.exists(os.path.join(topic.folder, new_name)):
+                logger.warning('Skipped: %s, new path already exists: %s' % (old_name, new_name))
+                continue
+            if isinstance(topic, LocalLegalInformationTopic):
+                topic.content.add_legal_title_and_shortdesc()  # the planned name is based on the standard title
+            topic_renames.append((topic, new_name))
+        topic_count = self.apply_topic_renames(topic_renames)
+        image_renames: list[tuple[Image, str]] = []
+        for old_href, new_href in plan.image_renames():
+            img = self.find_image(old_href)
+            if img is None:
+                logger.warning('Image from the rename plan is not in the map, skipping: ' + old_href)
+                continue
+            image_renames.append((img, new_href))
+        return topic_count, self.apply_image_renames(image_renames)
 
     def create_root_concept(self, title='How-to Guide'):
         template_path = os.path.join(
@@ -392,6 +1104,7 @@ class LocalMap(LocalProjectFile):
         rconcept = LocalConceptTopic(concept_path, self)
 
         self.topics.append(rconcept)
+        self.index_topic_links(rconcept)
 
         root_concept_element = deepcopy(self.content.root)
         ttl = root_concept_element.find('title')
@@ -402,6 +1115,7 @@ class LocalMap(LocalProjectFile):
         ttl.text = title
         self.content.root.insert(0, ttl)
         self.content.root.insert(1, root_concept_element)
+        self.content.changed()
         self.write()
 
     def add_topic_groups(self):
@@ -414,14 +1128,38 @@ class LocalTopic(LocalProjectFile):
     Get DITA outputclass, title, and shortdesc.
     """
 
-    def __init__(self, file_path: str, ditamap) -> None:
-        super().__init__(file_path)
+    def __init__(self, file_path: str, ditamap, content: XMLContent | None = None, lazy: bool = False) -> None:
+        super().__init__(file_path, content, lazy)
         self.ditamap = ditamap
-        if self.content.shortdesc_tag is None:
-            self.content.insert_shortdesc_tag()
-        self.images = self.get_images()
+        self._images: set[Image] | None = None
         self.children = []
         self.ish = None
+        self.assigned_outputclass: str | None = None  # outputclass given or detected during map loading
+        self.facts: TopicFacts | None = None  # from the project index, if the map has one
+        self._summary: TopicFacts | None = None  # from a streaming scan of the file
+        if self.content_loaded:
+            self.on_content_loaded()
+
+    def on_content_loaded(self) -> None:
+        if self.content.outputclass is None and self.assigned_outputclass is not None:
+            self.content.set_outputclass(self.assigned_outputclass)
+        if self.content.shortdesc_tag is None:
+            self.content.insert_shortdesc_tag()
+        self._images = self.get_images()
+
+    def reload(self) -> None:
+        self.facts = None
+        super().reload()
+
+    @property
+    def images(self) -> set['Image']:
+        if self._images is None and not self.content_loaded:
+            self.content  # parsing the topic also collects its images
+        return self._images
+
+    @images.setter
+    def images(self, new_images: set['Image']) -> None:
+        self._images = new_images
 
     def __repr__(self):
         return '<LocalTopic: ' + self.name + '>'
@@ -437,30 +1175,68 @@ class LocalTopic(LocalProjectFile):
         return contains
 
     def get_images(self):
+        """
+        Find the map images used in the topic figures, in one pass over the figures.
+        Updates the alt texts of the figures and takes the image titles from them.
+        """
         topic_images = []
-        for ditamap_image in self.ditamap.images:
-            ditamap_href = ditamap_image.href
-            for fig in self.content.root.iter('fig'):
-                topic_image_tag = fig.find('image')
-                if topic_image_tag is None:
-                    continue
-                image_href_in_topic = topic_image_tag.attrib.get('href')
-                if image_href_in_topic is None:
-                    continue
-                topic_image_title = fig.find('title')
-                alt = topic_image_tag.find('alt')
-                if alt is None:
-                    alt = TextElement('alt', '\u00A0')
-                    topic_image_tag.append(alt)
-                else:
-                    alt.text = '\u00A0'
-                if image_href_in_topic == ditamap_href or image_href_in_topic.split('/')[-1] == ditamap_href:
-                    if topic_image_title is not None and topic_image_title.text is not None:
-                        ditamap_image.title = topic_image_title.text.strip()
-                        alt.text = ditamap_image.title
-                    topic_images.append(ditamap_image)
+        if len(self.ditamap.images) == 0:
+            return set()
+        for fig in self.content.root.iter('fig'):
+            topic_image_tag = fig.find('image')
+            if topic_image_tag is None:
+                continue
+            image_href_in_topic = topic_image_tag.attrib.get('href')
+            if image_href_in_topic is None:
+                continue
+            alt = topic_image_tag.find('alt')
+            if alt is None:
+                alt = TextElement('alt', '\u00A0')
+                topic_image_tag.append(alt)
+            else:
+                alt.text = '\u00A0'
+            ditamap_image = self.ditamap.find_image(image_href_in_topic)
+            if ditamap_image is None:
+                continue
+            topic_image_title = fig.find('title')
+            if topic_image_title is not None and topic_image_title.text is not None:
+                ditamap_image.title = topic_image_title.text.strip()
+                alt.text = ditamap_image.title
+            topic_images.append(ditamap_image)
         return set(topic_images)
 
+    def get_summary(self) -> TopicFacts:
+        """
+        Title, shortdesc, outputclass and draft comment facts.
+        If the topic has not been parsed, they come from the project index or a streaming scan of the file.
+        """
+        if self.content_loaded:
+            return TopicFacts.from_content(self.path, self.content, self.file_state)
+        if self.facts is not None:
+            return self.facts
+        if self._summary is None:
+            self._summary = scan_topic(self.path)
+        return self._summary
+
+    def is_problematic(self) -> bool:
+        """
+        The topic has no title or shortdesc, or contains draft comments.
+        """
+        summary = self.get_summary()
+        return summary.shortdesc_missing or summary.title_missing or summary.has_draft_comments
+
+    def write(self, *args, **kwargs) -> None:
+        super().write(*args, **kwargs)
+        if self.ditamap is not None and self.ditamap.index is not None and self.ditamap.pending_writes is None:
+            self.ditamap.index.commit()  # inside LocalMap.write_behind(), the index is committed once at the end
+
+    def write_now(self, *args, **kwargs) -> bool:
+        written = super().write_now(*args, **kwargs)
+        if written and self.ditamap is not None and self.ditamap.index is not None:
+            self.facts = TopicFacts.from_content(self.path, self.content, self.file_state)
+            self.ditamap.index.put(self.facts)
+        return written
+
     def add_alt_texts_to_images(self):
         for image in self.images:
             for fig in self.content.root.iter('fig'):
@@ -478,21 +1254,26 @@ class LocalTopic(LocalProjectFile):
         self.write()
 
     def get_draft_comments(self):
-        draft_comments = []
-        for dc in self.content.root.iter('draft-comment'):
-            draft_comments.append((dc, self.content.parent_map[dc]))
-        return draft_comments
+        return self.content.draft_comments
 
     def insert_shortdesc_tag(self):
         self.content.insert_shortdesc_tag()
         self.write()
 
-    def create_new_name(self, num_rep):
+    def planned_title(self) -> str | None:
+        """
+        Title that the new file name is based on.
+        """
+        return self.content.title_tag.text
+
+    def create_new_name(self, num_rep, title_text: str | None = None):
         """
         Creates a filename that complies with the style guide, based on the document title.
         Takes into account repeating titles of different topics.
+        :param title_text: title to use instead of the one in the topic
         """
-        actual_title_text = self.content.title_tag.text or ' '.join(list(self.content.title_tag.itertext()))
+        actual_title_text = (title_text or self.content.title_tag.text
+                             or ' '.join(list(self.content.title_tag.itertext())))
         new_name = re.sub(r'[\s\W]', '_',
                           actual_title_text).replace('___',
                                                                '_').replace('__',
@@ -517,48 +1298,56 @@ class LocalTopic(LocalProjectFile):
     def rename_path(self, old_path, new_name):
         """
         Renames file in system.
+        Raises FileExistsError if another file has the new name, and keeps the topic path.
         """
+        new_path = os.path.join(self.folder, new_name + self.ext)
+        if os.path.exists(new_path):
+            raise FileExistsError('New path already exists: ' + new_path)
+        os.rename(old_path, new_path)
+        logger.info('renamed ' + old_path + ' to ' + new_path)
         self.name = new_name + self.ext
-        self.path = os.path.join(self.folder, self.name)
-        if os.path.exists(self.path):
-            logger.warning('New path already exists: ' + self.path)
-        else:
-            file_rename(old_path, self.path)
+        self.path = new_path
 
-    def update_name(self, num_rep):
+    def plan_new_name(self, num_rep) -> str | None:
         """
-        Updates file names and links to them in all the documents.
+        Works out the new file name for this topic without renaming anything.
         Takes into account repeating titles of different topics.
+        :return: new file name with extension, or None if the topic should not be renamed
         """
-        if isinstance(self, LocalLegalInformationTopic):
-            self.add_title_and_shortdesc()
-
-        old_topic = LocalTopic(self.path, self.ditamap)  # deep copy
-        if self.content.title_missing():
-            logger.info('Skipped: %s, nothing to rename (title missing)' % old_topic.name)
+        if not isinstance(self, LocalLegalInformationTopic) and self.content.title_missing():
+            logger.info('Skipped: %s, nothing to rename (title missing)' % self.name)
             return
 
-        logger.info('Updating name: ' + str(old_topic))
-        new_name = self.create_new_name(num_rep)
-        if old_topic.name == new_name:
-            logger.info('Skipped: %s' % old_topic.name)
+        logger.info('Updating name: %s', self)
+        new_name = self.create_new_name(num_rep, self.planned_title())
+        if new_name == self.name or new_name == self.basename:
+            logger.info('Skipped: %s' % self.name)
+            return
+        new_name = new_name + self.ext
+        if os.path.exists(os.path.join(self.folder, new_name)):
+            logger.warning('Skipped: %s, new path already exists: %s' % (self.name, new_name))
             return
+        return new_name
 
-        self.name = new_name
-        self.rename_path(old_topic.path, new_name)
-        # Update links to this file in all map topics
-        for t in self.ditamap.topics:
-            t.content.update_local_links(old_topic.name, new_name + '.dita')
-            t.write()
-        self.ditamap.update_topicref(old_topic.name, self.name)
-        if self.ish is not None:
-            self.ish.rename_with_path(self.ish.path, new_name)
+    def update_name(self, num_rep):
+        """
+        Updates file names and links to them in all the documents.
+        Takes into account repeating titles of different topics.
+        """
+        new_name = self.plan_new_name(num_rep)
+        if isinstance(self, LocalLegalInformationTopic):
+            self.content.add_legal_title_and_shortdesc()
+        if new_name is None:
+            if isinstance(self, LocalLegalInformationTopic):
+                self.write()
+            return
+        self.ditamap.apply_topic_renames([(self, new_name)])
 
     def cast_from_word(self):
         try:
             self._cast()
         except Exception as e:
-            logger.debug('Cannot cast ' + str(self) + ' to ' + str(self.__class__) + ':\n' + str(e))
+            logger.debug('Cannot cast %s to %s:\n%s', self, self.__class__, e)
 
     # def assign_type_from_prefix(self):
     #     prefix = self.name[0:2]
@@ -597,8 +1386,8 @@ class LocalTopic(LocalProjectFile):
 
 class LocalReferenceInformationTopic(LocalTopic):
 
-    def __init__(self, file_path, ditamap):
-        super().__init__(file_path, ditamap)
+    def __init__(self, file_path, ditamap, content=None, lazy=False):
+        super().__init__(file_path, ditamap, content, lazy)
 
     def __repr__(self):
         return '<LocalTopic - RefInfo: ' + self.name + '>'
@@ -610,12 +1399,15 @@ class LocalReferenceInformationTopic(LocalTopic):
 
 class LocalLegalInformationTopic(LocalTopic):
 
-    def __init__(self, file_path, ditamap):
-        super().__init__(file_path, ditamap)
+    def __init__(self, file_path, ditamap, content=None, lazy=False):
+        super().__init__(file_path, ditamap, content, lazy)
 
     def __repr__(self):
         return '<LocalTopic - LegalInfo: ' + self.name + '>'
 
+    def planned_title(self) -> str:
+        return legal_title  # added to the topic when it is renamed
+
     def add_title_and_shortdesc(self):
         self.content.add_legal_title_and_shortdesc()
         self.write()
@@ -627,8 +1419,8 @@ class LocalLegalInformationTopic(LocalTopic):
 
 class LocalConceptTopic(LocalTopic):
 
-    def __init__(self, file_path, ditamap):
-        super().__init__(file_path, ditamap)
+    def __init__(self, file_path, ditamap, content=None, lazy=False):
+        super().__init__(file_path, ditamap, content, lazy)
         self.children = []
 
     def __repr__(self):
@@ -641,8 +1433,8 @@ class LocalConceptTopic(LocalTopic):
 
 class LocalTaskTopic(LocalTopic):
 
-    def __init__(self, file_path, ditamap):
-        super().__init__(file_path, ditamap)
+    def __init__(self, file_path, ditamap, content=None, lazy=False):
+        super().__init__(file_path, ditamap, content, lazy)
 
     def __str__(self):
         return '<LocalTopic - Task: ' + self.name + '>'
@@ -658,9 +1450,13 @@ class LocalISHFile(LocalProjectFile):
     Can use XMLContent functions for getting FTITLE and FMODULETYPE.
     """
 
-    def __init__(self, file_path, ditamap):
-        super().__init__(file_path)
+    def __init__(self, file_path, ditamap, lazy=False):
+        super().__init__(file_path, lazy=lazy)
         self.ditamap = ditamap
+        if self.content_loaded:
+            self.check_ishobject()
+
+    def on_content_loaded(self) -> None:
         self.check_ishobject()
 
     def __repr__(self):
@@ -0,0 +1,67 @@
+import hashlib
+import mmap
+import os
+import re
+from contextlib import contextmanager
+
+from lxml import etree
+
+"""
+Reading project files from disk. Each file is read once: the same buffer provides
+the XML header, the parsed tree and the content hash.
+"""
+
+# Files of this size and larger are memory-mapped rather than read into memory
+mmap_threshold: int = 1024 * 1024
+# The XML declaration and the doctype are looked for in this many first bytes of the file
+header_search_limit: int = 64 * 1024
+
+
+@contextmanager
+def file_buffer(file_path: str):
+    """
+    Contents of the file, read from disk once.
+    Large files are memory-mapped instead of being copied into memory.
+    The buffer is only valid inside the with block.
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < mmap_threshold:
+            yield f.read()
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield buffer
+
+
+def parse_buffer(data: bytes | mmap.mmap, file_path: str) -> etree.Element:
+    if isinstance(data, bytes):
+        return etree.fromstring(data, base_url=file_path)
+    data.seek(0)  # lxml reads a memory-mapped file in chunks, like any other file object
+    return etree.parse(data, base_url=file_path).getroot()
+
+
+def find_xml_header(data: bytes | mmap.mmap) -> str | None:
+    """
+    Look for the XML declaration, or the XML declaration followed by the doctype declaration,
+    in the first 4 lines of the file contents. Only these lines are decoded.
+    """
+    head = data[:header_search_limit]
+    end = 0
+    for i in range(4):
+        end = head.find(b'\n', end) + 1
+        if end == 0:  # the file has fewer than 4 lines
+            end = len(head)
+            break
+    first_four_lines = head[:end].decode('utf-8', errors='replace').replace('\r\n', '\n')
+    declaration = r'(<\?xml version="1.0" encoding="UTF-8"\?>\n)(<!DOCTYPE.*?>\n)?'
+    found_declaration = re.findall(declaration, first_four_lines, re.DOTALL)
+    if len(found_declaration) > 0:
+        return ''.join(found_declaration[0])
+
+
+def hash_file_contents(data: bytes | mmap.mmap) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def hash_file(file_path: str) -> str:
+    with file_buffer(file_path) as buffer:
+        return hash_file_contents(buffer)
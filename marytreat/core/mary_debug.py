@@ -1,8 +1,16 @@
+import atexit
+import inspect
+import json
 import logging
+import logging.handlers
+import marshal
+import multiprocessing
 import os
+import queue
 import sys
+import threading
 from functools import wraps
-from marytreat.ui.utils import ErrorDialog
+from time import perf_counter
 import marytreat
 
 """
@@ -10,47 +18,148 @@ Logging and error handling
 """
 
 
-def create_log_file():
+def level_from_environment(variable: str, default: int) -> int:
+    """
+    :param variable: environment variable with a level name, ex. WARNING or warning, or a number
+    :return: the level, or the default if the variable is not set or is not a level
+    """
+    value = os.environ.get(variable, '').strip()
+    if not value:
+        return default
+    if value.isdigit():
+        return int(value)
+    level = logging.getLevelName(value.upper())
+    if isinstance(level, int):
+        return level
+    print('%s: unknown log level %s, using %s' % (variable, value, logging.getLevelName(default)), file=sys.stderr)
+    return default
+
+
+# Levels of the log outputs, can be overridden with environment variables, ex. MARYTREAT_CONSOLE_LOG_LEVEL=WARNING
+file_log_level: int = level_from_environment('MARYTREAT_FILE_LOG_LEVEL', logging.DEBUG)
+console_log_level: int = level_from_environment('MARYTREAT_CONSOLE_LOG_LEVEL', logging.INFO)
+log_max_bytes: int = 5 * 1024 * 1024
+log_backup_count: int = 3
+
+
+def create_log_file() -> logging.handlers.RotatingFileHandler:
     root = os.path.dirname(marytreat.__file__)
     log_folder = os.path.join(root, 'logs')
     if not os.path.exists(log_folder):
         os.makedirs(log_folder)
-    log_filename = os.path.join(log_folder, 'marytreat.log')
-    if os.path.exists(log_filename):
-        with open(log_filename, 'w'):  # clear file contents
-            pass
-    return log_filename
+    fh = logging.handlers.RotatingFileHandler(os.path.join(log_folder, 'marytreat.log'), maxBytes=log_max_bytes,
+                                              backupCount=log_backup_count, encoding='utf-8')
+    if os.path.getsize(fh.baseFilename) > 0:
+        fh.doRollover()  # each run starts a new log, the previous ones are kept as marytreat.log.1, .2...
+    return fh
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Put records in the queue with their messages merged with the arguments, so that an argument
+    that changes later, ex. a topic being renamed, is logged as it was at the call.
+    Unlike the standard QueueHandler, the time, level and exception are left to the outputs' formatters.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def create_log_outputs() -> dict[str, logging.Handler]:
+    formatter = logging.Formatter('%(asctime)s %(levelname)s: %(message)s')
+    outputs = {}
+    # worker processes of a parallel map load import this module again, and must not rotate the log
+    if multiprocessing.parent_process() is None:
+        fh = create_log_file()
+        fh.setLevel(file_log_level)
+        fh.setFormatter(formatter)
+        outputs['file'] = fh
+    ch = logging.StreamHandler()
+    ch.setLevel(console_log_level)
+    ch.setFormatter(formatter)
+    outputs['console'] = ch
+    return outputs
+
+
+"""
+All MaryLoggers put their records in one queue. A background thread takes them from the queue
+and writes them to the outputs, so that logging does not block the thread that logs.
+"""
+log_outputs: dict[str, logging.Handler] = create_log_outputs()
+log_queue: queue.SimpleQueue = queue.SimpleQueue()
+queue_handler = DeferredQueueHandler(log_queue)
+log_listener = logging.handlers.QueueListener(log_queue, *log_outputs.values(), respect_handler_level=True)
+
+
+def write_directly() -> None:
+    """
+    Worker processes do not have the writer thread, and may exit without running atexit functions,
+    so they write their records at once.
+    """
+    queue_handler.enqueue = log_listener.handle
+
+
+if multiprocessing.parent_process() is None:
+    log_listener.start()
+    atexit.register(log_listener.stop)  # write out the records still in the queue
+else:
+    write_directly()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=write_directly)
+
+
+def set_log_level(output: str, level: int) -> None:
+    """
+    :param output: 'file' or 'console'
+    """
+    log_outputs[output].setLevel(level)
+    for mary_logger in [lg for lg in logging.Logger.manager.loggerDict.values() if isinstance(lg, MaryLogger)]:
+        mary_logger.setLevel(lowest_log_level())
+        # the logger caches the levels it has been checked for
+        mary_logger._cache.clear()
+
+
+def lowest_log_level() -> int:
+    """
+    Records below the level of every output are dropped before they are created.
+    """
+    return min(h.level for h in log_outputs.values())
+
+
+# Without a display, ex. in batch processing, errors are only logged
+headless: bool = False
+
+
+def show_error(msg) -> None:
+    # Tk is not thread-safe: background threads marked as headless, ex. a MapWatcher, only log their errors
+    if not headless and not getattr(threading.current_thread(), 'headless', False):
+        from marytreat.ui.utils import ErrorDialog  # not imported in batch processing, where there may be no Tk
+        ErrorDialog(msg)
 
 
 class MaryLogger(logging.Logger):
 
     def __init__(self, name):
         super().__init__(name)
-        self.setLevel(logging.DEBUG)
-        log_filename = create_log_file()
-        fh = logging.FileHandler(log_filename, encoding='utf-8')
-        fh.setLevel(logging.DEBUG)
-        fh.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s'))
-        self.addHandler(fh)
-        ch = logging.StreamHandler()
-        ch.setLevel(logging.DEBUG)
-        ch.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s'))
-        self.addHandler(ch)
+        self.setLevel(lowest_log_level())
+        self.addHandler(queue_handler)
 
     def error(self, msg, *args, **kwargs):
         self._log(logging.ERROR, msg, args, **kwargs)
-        ErrorDialog(msg)
+        show_error(msg)
 
     def critical(self, msg, *args, **kwargs):
         self._log(logging.CRITICAL, msg, args, **kwargs)
-        ErrorDialog(msg)
+        show_error(msg)
 
     def exception(self, msg, *args, exc_info=True, **kwargs):
         """
         Delegate an exception call to the underlying logger.
         """
         self._log(logging.ERROR, msg, *args, exc_info=exc_info, **kwargs)
-        ErrorDialog(msg)
+        show_error(msg)
 
 
 logging.setLoggerClass(MaryLogger)
@@ -59,7 +168,7 @@ logger = logging.getLogger(__name__)
 
 def uncaught_exception_handler(exctype, value, traceback):
     logging.error("An unhandled exception occurred:", exc_info=(exctype, value, traceback))
-    ErrorDialog(traceback)
+    show_error(traceback)
 
 
 sys.excepthook = uncaught_exception_handler
@@ -80,9 +189,162 @@ def debug(func):
     return wrapper
 
 
+"""
+Profiling
+
+Set the MARYTREAT_PROFILE environment variable to collect call counts and times of the methods
+of the classes decorated with @debugmethods. If its value is a file path, the statistics are written
+there on exit: as JSON if the path ends with .json, otherwise in the pstats format
+(python -m pstats <file>). The variable is read at import time. Without it, the classes are left
+as they are and the methods run without any overhead.
+"""
+
+
+class MethodStats:
+    """
+    Calls of one instrumented function.
+    """
+
+    def __init__(self, func) -> None:
+        code = inspect.unwrap(func).__code__  # the code of the method, not of a decorator wrapper
+        self.key: tuple[str, int, str] = (code.co_filename, code.co_firstlineno, func.__qualname__)
+        self.calls = 0  # all calls
+        self.primitive_calls = 0  # calls that are not recursive
+        self.total_time = 0.0  # cumulative: time spent in the function and everything it calls
+        self.self_time = 0.0  # time spent in the function, minus other instrumented functions
+        self.callers: dict[tuple[str, int, str], list] = {}  # caller key -> [calls, primitive calls, self, cumulative]
+
+    def __repr__(self) -> str:
+        return '<MethodStats: %s, %d calls, %.4f s>' % (self.key[2], self.calls, self.total_time)
+
+    def as_dict(self) -> dict:
+        return {'name': self.key[2], 'file': self.key[0], 'line': self.key[1],
+                'calls': self.calls, 'primitive_calls': self.primitive_calls,
+                'total_time': self.total_time, 'self_time': self.self_time,
+                'callers': {caller[2]: calls for caller, (calls, _, _, _) in self.callers.items()}}
+
+
+class Profiler:
+    """
+    In-process registry of method statistics.
+    Time spent in a nested instrumented call is counted in the cumulative time of the caller,
+    but not in its self time.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.stats: dict[tuple[str, int, str], MethodStats] = {}
+        self.local = threading.local()  # stack of running instrumented calls, per thread
+        self.lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return '<Profiler: %d functions%s>' % (len(self.stats), '' if self.enabled else ', disabled')
+
+    def instrument(self, func):
+        stats = MethodStats(func)
+        stats = self.stats.setdefault(stats.key, stats)
+        local = self.local
+        lock = self.lock
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            stack = getattr(local, 'stack', None)
+            if stack is None:
+                stack = local.stack = []
+                local.running = {}
+            running = local.running
+            recursive = running.get(stats.key, 0) > 0
+            running[stats.key] = running.get(stats.key, 0) + 1
+            frame = [stats, 0.0]  # the function, time spent in instrumented calls it made
+            stack.append(frame)
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                stack.pop()
+                running[stats.key] -= 1
+                own = elapsed - frame[1]
+                caller = stack[-1] if stack else None
+                if caller is not None:
+                    caller[1] += elapsed
+                with lock:
+                    stats.calls += 1
+                    stats.self_time += own
+                    if not recursive:
+                        stats.primitive_calls += 1
+                        stats.total_time += elapsed
+                    if caller is not None:
+                        entry = stats.callers.setdefault(caller[0].key, [0, 0, 0.0, 0.0])
+                        entry[0] += 1
+                        entry[1] += 0 if recursive else 1
+                        entry[2] += own
+                        entry[3] += 0.0 if recursive else elapsed
+
+        return wrapper
+
+    def reset(self) -> None:
+        with self.lock:
+            for stats in self.stats.values():
+                stats.calls = stats.primitive_calls = 0
+                stats.total_time = stats.self_time = 0.0
+                stats.callers.clear()
+
+    def called(self) -> list[MethodStats]:
+        """
+        :return: functions that have been called, the most time-consuming first
+        """
+        return sorted((s for s in self.stats.values() if s.calls > 0), key=lambda s: s.total_time, reverse=True)
+
+    def report(self, limit: int = 20) -> str:
+        lines = ['%10s %10s %10s  %s' % ('calls', 'total, s', 'self, s', 'method')]
+        for stats in self.called()[:limit]:
+            lines.append('%10d %10.4f %10.4f  %s' % (stats.calls, stats.total_time, stats.self_time, stats.key[2]))
+        return '\n'.join(lines)
+
+    def export_json(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump([s.as_dict() for s in self.called()], f, indent=1)
+
+    def export_pstats(self, path: str) -> None:
+        """
+        Write the statistics in the format of cProfile, to be read with pstats.Stats(path).
+        """
+        stats = {s.key: (s.primitive_calls, s.calls, s.self_time, s.total_time,
+                         {caller: tuple(entry) for caller, entry in s.callers.items()})
+                 for s in self.called()}
+        with open(path, 'wb') as f:
+            marshal.dump(stats, f)
+
+    def export(self, path: str) -> None:
+        if path.endswith('.json'):
+            self.export_json(path)
+        else:
+            self.export_pstats(path)
+        logger.info('Profile written to ' + path)
+
+
+profile_setting = os.environ.get('MARYTREAT_PROFILE', '')
+profiler = Profiler(enabled=profile_setting not in ('', '0'))
+
+if profiler.enabled:
+    atexit.register(lambda: logger.info('Profile of the slowest methods:\n' + profiler.report()))
+    if profile_setting != '1':
+        atexit.register(profiler.export, profile_setting)
+
+
 def debugmethods(cls):
-    for k, v in vars(cls).items():
-        if callable(v):
-            type(v)
-            setattr(cls, k, debug(v))
+    """
+    Instrument the methods of a class for the profiler. Does nothing if profiling is disabled.
+    Dunder methods other than __init__ are called too often to be worth timing, and are left out.
+    """
+    if not profiler.enabled:
+        return cls
+    for k, v in list(vars(cls).items()):
+        if k.startswith('__') and k != '__init__':
+            continue
+        if isinstance(v, (staticmethod, classmethod)):
+            setattr(cls, k, type(v)(profiler.instrument(v.__func__)))
+        elif inspect.isfunction(v):
+            setattr(cls, k, profiler.instrument(v))
     return cls
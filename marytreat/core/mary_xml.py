@@ -1,4 +1,5 @@
 from copy import deepcopy
+from functools import wraps
 from re import search
 
 from lxml import etree
@@ -6,6 +7,8 @@ from lxml import etree
 from marytreat.core.constants import Constants
 from marytreat.core.mary_debug import logger, debugmethods
 
+legal_title: str = 'Legal information'
+
 
 def TextElement(tag: str, text: str, *args, **kwargs) -> etree.Element:
     element = etree.Element(tag, *args, **kwargs)
@@ -28,6 +31,55 @@ def is_list_item(p: etree.Element):
     return False
 
 
+def title_missing(title_tag: etree.Element | None) -> bool:
+    if title_tag is None:
+        return True
+    if len(title_tag) > 0:  # contains another tag
+        actual_title_text = ' '.join(list(title_tag.itertext()))
+    else:
+        actual_title_text = title_tag.text
+    if not actual_title_text or 'MISSING TITLE' in actual_title_text:
+        return True
+    return False
+
+
+def shortdesc_missing(shortdesc_tag: etree.Element | None) -> bool:
+    if shortdesc_tag is None:
+        return True
+    if len(shortdesc_tag) > 0:  # contains another tag
+        return False
+    actual_shortdesc = shortdesc_tag.text or ' '.join(list(shortdesc_tag.itertext()))
+    if not actual_shortdesc or 'SHORT DESCRIPTION' in actual_shortdesc:
+        return True
+    return False
+
+
+def tag_text(tag: etree.Element | None) -> str | None:
+    """
+    Text of a title or shortdesc, including the text of nested tags.
+    """
+    if tag is None:
+        return
+    return tag.text or ' '.join(list(tag.itertext()))
+
+
+def link_target(href: str) -> str:
+    """
+    :param href: local link, ex. ../topics/r_2_1_1.dita#r_2_1_1/table_1
+    :return: name of the linked file, ex. r_2_1_1.dita
+    """
+    return href.partition('#')[0].rpartition('/')[2]
+
+
+def retarget_link(href: str, new_name: str) -> str:
+    """
+    Replace the file name in a local link, keeping its folder and element parts.
+    """
+    file_part, hash_sign, element_part = href.partition('#')
+    folder, slash, _ = file_part.rpartition('/')
+    return folder + slash + new_name + hash_sign + element_part
+
+
 def convert_to_simpletable(tbl: etree.Element):
     tbl.tag = 'simpletable'
     widths = [colspec.attrib.get('colwidth') for colspec in tbl.findall('colspec')]
@@ -44,6 +96,51 @@ def convert_to_simpletable(tbl: etree.Element):
     parent.insert(parent.index(tbl) + 1, TextElement('p', '\u00A0'))
 
 
+class TreeFacts:
+    """
+    What the map needs to know about a tree to classify it and find problems, collected in one walk.
+    """
+
+    def __init__(self, root: etree.Element) -> None:
+        self.has_ol = False  # an ol right under the root
+        self.has_list_item = False  # a p that looks like a list item
+        self.has_table = False
+        self.draft_comments: list[tuple[etree.Element, etree.Element]] = []  # draft comments and their parents
+        self.local_links: list[etree.Element] = []
+        self.images: list[etree.Element] = []
+        for el in root.iter(etree.Element):
+            tag = el.tag
+            if tag == 'p':
+                if not self.has_list_item and is_list_item(el):
+                    self.has_list_item = True
+            elif tag == 'xref':
+                if el.attrib.get('scope') == 'local':
+                    self.local_links.append(el)
+            elif tag == 'image':
+                self.images.append(el)
+            elif tag == 'table' or tag == 'simpletable':
+                self.has_table = True
+            elif tag == 'ol':
+                if el.getparent() is root:
+                    self.has_ol = True
+            elif tag == 'draft-comment':
+                self.draft_comments.append((el, el.getparent()))
+
+
+def changes_tree(method):
+    """
+    Forget the facts about the tree after an XMLContent method that changes its structure.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._facts = None
+
+    return wrapper
+
+
 @debugmethods
 class XMLContent:
 
@@ -53,11 +150,34 @@ class XMLContent:
         self.root = root
         self.header = header
         self.tree = etree.ElementTree(element=root)
-        self.parent_map: dict[etree.Element, etree.Element] = {c: p for p in self.root.iter() for c in p}
+        self.source_hash: str | None = None  # hash of the file contents the tree was parsed from
         self.title_tag = self.root.find('title')
         self.shortdesc_tag = self.root.find('shortdesc')
         self.outputclass = self.root.attrib.get('outputclass')
-        self.local_links = self.root.findall('.//xref[@scope="local"]')
+        self._facts: TreeFacts | None = None
+
+    @property
+    def facts(self) -> TreeFacts:
+        """
+        Collected on first use, and again after the tree has changed.
+        """
+        if self._facts is None:
+            self._facts = TreeFacts(self.root)
+        return self._facts
+
+    def changed(self) -> None:
+        """
+        Call this after changing the structure of the tree other than with the methods of this class.
+        """
+        self._facts = None
+
+    @property
+    def local_links(self) -> list[etree.Element]:
+        return self.facts.local_links
+
+    @property
+    def image_tags(self) -> list[etree.Element]:
+        return self.facts.images
 
     def set_header(self, new_header):
         self.header = new_header
@@ -74,8 +194,9 @@ class XMLContent:
 
     @property
     def has_draft_comments(self):
-        return True if len(self.draft_comments) > 0 else False
+        return len(self.facts.draft_comments) > 0
 
+    @changes_tree
     def add_nbsp_after_table(self) -> etree.Element:
         """
         Appends a blank paragraph after the table.
@@ -91,33 +212,14 @@ class XMLContent:
         parent.insert(tbl_index + 1, TextElement('p', '\u00A0'))
 
     def title_missing(self):
-        if self.title_tag is None:
-            return True
-        if len(self.title_tag) > 0:  # contains another tag
-            actual_title_text = ' '.join(list(self.title_tag.itertext()))
-        else:
-            actual_title_text = self.title_tag.text
-        if not actual_title_text or 'MISSING TITLE' in actual_title_text:
-            return True
-        return False
+        return title_missing(self.title_tag)
 
     def shortdesc_missing(self):
-        if self.shortdesc_tag is None:
-            return True
-        if len(self.shortdesc_tag) > 0:  # contains another tag
-            return False
-        actual_shortdesc = self.shortdesc_tag.text or ' '.join(list(self.shortdesc_tag.itertext()))
-        if not actual_shortdesc or 'SHORT DESCRIPTION' in actual_shortdesc:
-            return True
-        return False
+        return shortdesc_missing(self.shortdesc_tag)
 
     @property
     def draft_comments(self):
-        draft_comments = []
-        for dc in self.root.iter('draft-comment'):
-            if dc is not None:
-                draft_comments.append((dc, self.parent_map[dc]))
-        return draft_comments
+        return list(self.facts.draft_comments)
 
     def set_outputclass(self, oc):
         self.root.set('outputclass', oc)
@@ -137,7 +239,7 @@ class XMLContent:
         """
         if self.outputclass == 'frontcover' or self.outputclass == 'backcover':
             return
-        parent_tag = self.parent_map[self.title_tag]
+        parent_tag = self.title_tag.getparent()
         if len(parent_tag.findall('shortdesc')) < 1:
             self.shortdesc_tag = TextElement('shortdesc', 'SHORT DESCRIPTION')
             parent_tag.insert(1, self.shortdesc_tag)
@@ -151,16 +253,15 @@ class XMLContent:
         """
         if len(self.local_links) == 0:
             return
-        logger.debug('Title: ' + str(self.title_tag.text))
-        logger.debug('Links: ' + str([l.attrib.get('href') for l in self.local_links]))
-        logger.debug('Renaming links from ' + old_name + ' to ' + new_name)
+        logger.debug('Title: %s', self.title_tag.text)
+        logger.debug('Links: %s', [l.attrib.get('href') for l in self.local_links])
+        logger.debug('Renaming links from %s to %s', old_name, new_name)
         for link in self.local_links:
             link_href = link.attrib.get('href')
             if old_name in link_href:
-                logger.info("'" + str(self.title_tag.text) + "'" +
-                            ' has old link to ' + new_name + ' (%s)' % link_href)
+                logger.info("'%s' has old link to %s (%s)", self.title_tag.text, new_name, link_href)
                 new_name = link_href.replace(old_name, new_name)
-                logger.info('Updated link href: ' + new_name + '\n')
+                logger.info('Updated link href: %s\n', new_name)
                 link.set('href', new_name)
 
     def fattribute(self, attr_name, mode, new_value=None):  # for ishfiles only
@@ -179,6 +280,7 @@ class XMLContent:
                                   'new_value=\'myvalue\') #  set value if mode=\'set\'.',
                                   'This method can set fname or fmoduletype')
 
+    @changes_tree
     def process_docdetails(self):
         """
         Identify docdetails topic, add shortdesc, convert CALS table to simpletable.
@@ -194,7 +296,7 @@ class XMLContent:
             convert_to_simpletable(table_tag)  # also adds nbsp after table
 
     def add_legal_title_and_shortdesc(self):
-        self.set_title('Legal information')
+        self.set_title(legal_title)
         self.insert_shortdesc_tag()
         for first_level in self.root:
             for x in first_level:
@@ -204,6 +306,7 @@ class XMLContent:
                         self.set_shortdesc(redundant_p.text)
                         return
 
+    @changes_tree
     def rename_tag(self, tag_name, new_name):
         if tag_name != self.root.tag:
             elems = self.root.findall(tag_name)
@@ -238,6 +341,7 @@ class XMLContent:
         self.rename_tag('body', 'taskbody')
         self.convert_lists_to_steps()
 
+    @changes_tree
     def convert_lists_to_steps(self):
         # if there are no ol's,
         # then get all p's that look like list items, that is:
@@ -258,6 +362,7 @@ class XMLContent:
                 convert_tag_to_step(p)
             self.wrap_steps()
 
+    @changes_tree
     def wrap_steps(self):
         assert self.outputclass == 'procedure'
         taskbody = self.root.findall('taskbody')[0]
@@ -269,20 +374,12 @@ class XMLContent:
         taskbody.append(steps)
 
     def is_mostly_list(self):
-        ol = self.root.find('ol')
-        if ol is not None:
-            return True
-        for p in self.root.iter('p'):
-            if is_list_item(p):
-                return True
-        return False
+        return self.facts.has_ol or self.facts.has_list_item
 
     def has_table(self):
-        tables = [t.tag for t in self.root.iter('table')] + [st.tag for st in self.root.iter('simpletable')]
-        if len(tables) > 0:
-            return True
-        return False
+        return self.facts.has_table
 
+    @changes_tree
     def move_title_shortdesc_text_from_p(self):
         try:
             body = self.tree.xpath('refbody|body')[0]
@@ -307,23 +404,12 @@ class XMLContent:
             return 'explanation'
 
     def wrap_images_in_fig(self):
-        if len(self.root.findall('fig')) > 0:
-            return
-        for image in self.root.iter('image'):
-            img_tag = deepcopy(image)
-            image.tag = 'fig'
-            image.clear()
-            image.append(img_tag)
+        self.apply_transforms([WrapImagesInFig()])
 
     def images_to_png(self):
-        for image in self.root.iter('image'):
-            href = image.attrib.get('href')
-            href_and_ext = href.split('.')
-            if href_and_ext[-1] != 'png':
-                href_png = '.'.join((href_and_ext[0], 'png'))
-                logger.debug(href_png)
-                image.set('href', href_png)
+        self.apply_transforms([ImagesToPng()])
 
+    @changes_tree
     def add_topic_groups(self):
         if self.root.findall('topicgroup'):
             return
@@ -340,39 +426,26 @@ class XMLContent:
         self.root[1].insert(-2, appendix_group)
 
     def process_notes(self):
-        for el in self.root.iter():
-            if not el.text:
-                continue
-            whitespace_only = list(filter(lambda i: ord(i) == 32 or ord(i) == 10,
-                                          [item for item in el.text]))
-            if whitespace_only:
-                continue
-            if 'NOTE:' in el.text:
-                el.text.replace('NOTE:', '')
-                logger.debug('Found a note!', self.tree.getpath(el))
-                if el.tag == 'p':
-                    note_content = deepcopy(el)
-                    note = el
-                else:
-                    nearest_p = yield etree.AncestorsIterator(el, 'p')
-                    note_content = deepcopy(nearest_p)
-                    note = nearest_p
-                note.tag = 'note'
-                note.clear()
-                note.append(note_content)
-                logger.debug(self.tree.getpath(note_content))
+        self.apply_transforms([ProcessNotes()])
 
     def create_shortdesc_from_first_p(self):
-        if self.shortdesc_missing():
-            body = self.tree.xpath('body|refbody|taskbody|conbody')
-            try:
-                first_el = body[0][0]
-                following_el = body[0][1]
-                if first_el.tag == 'p' and first_el.text and not following_el.find('image'):
-                    self.shortdesc_tag.text = first_el.text
-                    body[0].remove(first_el)
-            except IndexError:
-                return
+        self.apply_transforms([ShortdescFromFirstP()])
+
+    @changes_tree
+    def apply_transforms(self, transforms: list['TreeTransform']) -> None:
+        """
+        Run several transforms in one walk over the tree. Each element is passed to the transforms
+        that handle its tag, in the order of the list.
+        """
+        active = [t for t in transforms if t.start(self)]
+        if any(t.tags is None or len(t.tags) > 0 for t in active):
+            # elements added by a handler are not visited
+            for el in list(self.root.iter(etree.Element)):
+                for t in active:
+                    if t.tags is None or el.tag in t.tags:
+                        t.handle(self, el)
+        for t in active:
+            t.finish(self)
 
     def gen_shortdesc(self):
         """
@@ -398,6 +471,7 @@ class XMLContent:
         logger.debug(str(self) + ': ' + new_shortdesc)
         return new_shortdesc
 
+    @changes_tree
     def remove_context(self):
         if self.outputclass != 'procedure':
             return
@@ -408,3 +482,111 @@ class XMLContent:
         except IndexError as e:
             logger.info(e)
             return
+
+
+class TreeTransform:
+    """
+    A change to a topic tree that can run together with other transforms in one walk, see XMLContent.apply_transforms.
+    """
+
+    tags: tuple[str, ...] | None = ()  # tags of the elements passed to handle(); None for all elements
+
+    def start(self, content: XMLContent) -> bool:
+        """
+        :return: False if the tree does not need this transform
+        """
+        return True
+
+    def handle(self, content: XMLContent, el: etree.Element) -> None:
+        pass
+
+    def finish(self, content: XMLContent) -> None:
+        """
+        Called after the walk, for changes that do not need one.
+        """
+        pass
+
+
+class WrapImagesInFig(TreeTransform):
+    tags = ('image',)
+
+    def start(self, content: XMLContent) -> bool:
+        return len(content.root.findall('fig')) == 0
+
+    def handle(self, content: XMLContent, el: etree.Element) -> None:
+        # the image itself moves into the fig, so the transforms that come next still get it
+        fig = etree.Element('fig')
+        el.addprevious(fig)
+        fig.append(el)
+
+
+class ImagesToPng(TreeTransform):
+    tags = ('image',)
+
+    def handle(self, content: XMLContent, el: etree.Element) -> None:
+        href = el.attrib.get('href')
+        href_and_ext = href.split('.')
+        if href_and_ext[-1] != 'png':
+            href_png = '.'.join((href_and_ext[0], 'png'))
+            logger.debug(href_png)
+            el.set('href', href_png)
+
+
+class ProcessNotes(TreeTransform):
+    """
+    Turn the paragraphs with a NOTE: label into notes. The label is removed, because the note gets its own
+    when published, and so is an inline element, ex. <b>, that held nothing but the label.
+    """
+    tags = None
+
+    def handle(self, content: XMLContent, el: etree.Element) -> None:
+        if not el.text or not el.text.strip() or 'NOTE:' not in el.text:
+            return
+        p = el if el.tag == 'p' else next(el.iterancestors('p'), None)
+        if p is None or p.getparent() is None or p.getparent().tag == 'note':
+            return
+        logger.debug('Found a note: %s', content.tree.getpath(p))
+        el.text = el.text.replace('NOTE:', '', 1).lstrip() or None
+        if el is not p and el.text is None and len(el) == 0:
+            remove_keeping_tail(el)
+        # the paragraph becomes the note, and its contents move to a new paragraph inside
+        note_content = etree.Element('p', dict(p.attrib))
+        note_content.text = p.text.lstrip() if p.text and p.text.strip() else None
+        note_content.extend(list(p))
+        p.attrib.clear()
+        p.text = None
+        p.tag = 'note'
+        p.append(note_content)
+
+
+def remove_keeping_tail(el: etree.Element) -> None:
+    """
+    Remove an element, and keep the text that follows it in its parent.
+    """
+    parent = el.getparent()
+    if el.tail:
+        previous = el.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or '') + el.tail
+        else:
+            parent.text = (parent.text or '') + el.tail
+    parent.remove(el)
+
+
+class ShortdescFromFirstP(TreeTransform):
+    """
+    If the shortdesc is missing, take the first paragraph of the body, unless an image follows it.
+    """
+
+    def finish(self, content: XMLContent) -> None:
+        if not content.shortdesc_missing():
+            return
+        body = content.tree.xpath('body|refbody|taskbody|conbody')
+        try:
+            first_el = body[0][0]
+            following_el = body[0][1]
+        except IndexError:
+            return
+        if first_el.tag == 'p' and first_el.text and following_el.find('image') is None:
+            content.set_shortdesc(first_el.text)
+            body[0].remove(first_el)
@@ -5,6 +5,7 @@ from shutil import copy2
 from docx import Document
 
 from marytreat.core import local as l
+from marytreat.core.mary_xml import TreeTransform, WrapImagesInFig, ProcessNotes, ShortdescFromFirstP, ImagesToPng
 
 
 def clear_drawing_descriptions(document):
@@ -52,25 +53,29 @@ def get_ditamap(proj_folder):
             return word_ditamap
 
 
-def after_conversion(project_folder):
-    ditamap = get_ditamap(project_folder)
-    ditamap.create_root_concept()
+# Changes to every topic after the conversion, made in one walk over each tree
+conversion_transforms: list[type[TreeTransform]] = [WrapImagesInFig, ProcessNotes, ShortdescFromFirstP, ImagesToPng]
 
-    docdetails = ditamap.topics[0]  # assume it's the first topic in the map
-    docdetails.format_docdetails()
 
-    for t in ditamap.topics:
-        t.content.wrap_images_in_fig()
-        t.content.process_notes()
-        t.content.create_shortdesc_from_first_p()
-        t.write()
+def after_conversion(project_folder, ditamap=None):
+    """
+    :param ditamap: the map of the project, if it is already loaded
+    """
+    if ditamap is None:
+        ditamap = get_ditamap(project_folder)
+    with ditamap.write_behind():
+        ditamap.create_root_concept()
 
-    for t in ditamap.topics:
-        t.content.images_to_png()
-        t.write()
+        docdetails = ditamap.topics[0]  # assume it's the first topic in the map
+        docdetails.format_docdetails()
 
-    ditamap.add_topic_groups()
-    ditamap.write()
+        transforms = [t() for t in conversion_transforms]
+        for t in ditamap.topics:
+            t.content.apply_transforms(transforms)
+            t.write()
+
+        ditamap.add_topic_groups()
+        ditamap.write()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,152 @@
+import json
+import os
+import sqlite3
+
+from marytreat.core.mary_debug import logger
+from marytreat.core.mary_xml import XMLContent, tag_text
+
+"""
+Persistent index of topic facts, stored next to the ditamap.
+Lets a map be reopened without parsing the topics that have not changed since the last time.
+"""
+
+
+class TopicFacts:
+    """
+    Everything the map needs to know about a topic before its tree is parsed.
+    """
+
+    def __init__(self, path: str, content_hash: str | None = None, file_state: tuple[int, int] | None = None,
+                 title: str | None = None, title_missing: bool = True,
+                 shortdesc: str | None = None, shortdesc_missing: bool = True,
+                 outputclass: str | None = None, has_draft_comments: bool = False,
+                 local_links: list[str] | None = None, image_hrefs: list[str] | None = None) -> None:
+        self.path = path
+        self.content_hash = content_hash
+        self.file_state = file_state
+        self.title = title
+        self.title_missing = title_missing
+        self.shortdesc = shortdesc
+        self.shortdesc_missing = shortdesc_missing
+        self.outputclass = outputclass
+        self.has_draft_comments = has_draft_comments
+        self.local_links = local_links  # None if unknown, ex. for facts from a streaming scan
+        self.image_hrefs = image_hrefs
+
+    def __repr__(self) -> str:
+        return '<TopicFacts: ' + os.path.basename(self.path) + '>'
+
+    @classmethod
+    def from_content(cls, path: str, content: XMLContent, file_state: tuple[int, int] | None = None) -> 'TopicFacts':
+        return cls(path,
+                   content_hash=content.source_hash,
+                   file_state=file_state,
+                   title=tag_text(content.title_tag),
+                   title_missing=content.title_missing(),
+                   shortdesc=tag_text(content.shortdesc_tag),
+                   shortdesc_missing=content.shortdesc_missing(),
+                   outputclass=content.outputclass,
+                   has_draft_comments=content.has_draft_comments,
+                   local_links=[link.attrib.get('href') for link in content.local_links if link.attrib.get('href')],
+                   image_hrefs=[img.attrib.get('href') for img in content.image_tags if img.attrib.get('href')])
+
+
+class ProjectIndex:
+    """
+    SQLite file next to the ditamap, ex. my_guide.ditamap -> my_guide.marytreat.db.
+    Topic paths are stored relative to the map folder, so the index survives moving the project folder.
+    The index is a cache: if the file is corrupt, it is recreated.
+    """
+
+    version = 1
+
+    def __init__(self, ditamap_path: str) -> None:
+        self.folder = os.path.dirname(ditamap_path)
+        self.path = os.path.splitext(ditamap_path)[0] + '.marytreat.db'
+        try:
+            self.connection = self.connect()
+        except sqlite3.OperationalError:
+            raise  # ex. a read-only or locked folder, where the file may be fine and cannot be replaced anyway
+        except sqlite3.DatabaseError as e:
+            logger.warning('Project index is corrupt, creating a new one: ' + str(e))
+            os.remove(self.path)
+            self.connection = self.connect()
+
+    def connect(self) -> sqlite3.Connection:
+        # The map is loaded in a worker thread and then edited from the UI thread, one at a time
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute('PRAGMA synchronous = OFF')  # a lost update only means a topic is parsed again
+        if connection.execute('PRAGMA user_version').fetchone()[0] != self.version:
+            connection.execute('DROP TABLE IF EXISTS topics')
+            connection.execute('PRAGMA user_version = %d' % self.version)
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS topics (
+                path TEXT PRIMARY KEY,
+                content_hash TEXT,
+                mtime_ns INTEGER,
+                size INTEGER,
+                title TEXT,
+                title_missing INTEGER,
+                shortdesc TEXT,
+                shortdesc_missing INTEGER,
+                outputclass TEXT,
+                has_draft_comments INTEGER,
+                local_links TEXT,
+                image_hrefs TEXT
+            )''')
+        connection.commit()
+        return connection
+
+    def __repr__(self) -> str:
+        return '<ProjectIndex: ' + self.path + '>'
+
+    def get(self, topic_path: str) -> TopicFacts | None:
+        row = self.connection.execute('SELECT * FROM topics WHERE path = ?',
+                                      (os.path.relpath(topic_path, self.folder),)).fetchone()
+        if row is None:
+            return
+        (_, content_hash, mtime_ns, size, title, title_missing, shortdesc, shortdesc_missing,
+         outputclass, has_draft_comments, local_links, image_hrefs) = row
+        return TopicFacts(topic_path, content_hash, (mtime_ns, size), title, bool(title_missing),
+                          shortdesc, bool(shortdesc_missing), outputclass, bool(has_draft_comments),
+                          json.loads(local_links), json.loads(image_hrefs))
+
+    def get_fresh(self, topic_path: str, file_state: tuple[int, int], read_hash=None) -> TopicFacts | None:
+        """
+        :param file_state: current modification time and size of the topic file
+        :param read_hash: function that hashes the current file contents;
+        used when the file was touched or copied, to check whether it has really changed
+        :return: indexed facts, if they are still valid for the file on disk
+        """
+        facts = self.get(topic_path)
+        if facts is None:
+            return
+        if facts.file_state == file_state:
+            return facts
+        if read_hash is not None and facts.content_hash is not None and read_hash() == facts.content_hash:
+            facts.file_state = file_state
+            self.put(facts)
+            return facts
+
+    def put(self, facts: TopicFacts) -> None:
+        mtime_ns, size = facts.file_state or (None, None)
+        self.connection.execute('INSERT OR REPLACE INTO topics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+            os.path.relpath(facts.path, self.folder), facts.content_hash, mtime_ns, size,
+            facts.title, int(facts.title_missing), facts.shortdesc, int(facts.shortdesc_missing),
+            facts.outputclass, int(facts.has_draft_comments),
+            json.dumps(facts.local_links), json.dumps(facts.image_hrefs)))
+
+    def prune(self, topic_paths: set[str]) -> None:
+        """
+        Remove entries for topics that are no longer in the map.
+        """
+        relpaths = {os.path.relpath(p, self.folder) for p in topic_paths}
+        stale = [(p,) for (p,) in self.connection.execute('SELECT path FROM topics') if p not in relpaths]
+        self.connection.executemany('DELETE FROM topics WHERE path = ?', stale)
+
+    def commit(self) -> None:
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
@@ -3,9 +3,8 @@ from tkinter import *
 from tkinter import filedialog
 from tkinter import messagebox
 
-from lxml import etree
-
 from marytreat.core.constants import Constants
+from marytreat.core.flare_images import process_project
 
 padding = Constants.PADDING.value
 
@@ -25,40 +24,18 @@ class RenameImageFile(LabelFrame):
         rename_button = Button(self, text='Rename images', command=self.call_rename_image_links)
         rename_button.grid(row=0, column=2, **padding, sticky=EW)
 
-    def rename_image_file(self, filename, image_folder_path):
-        image_extensions = ['.png', '.gif', '.jpg', '.eps', '.cdr', '.wmf']
-        image_extensions += [ext.upper() for ext in image_extensions]
-        if filename.endswith(tuple(image_extensions)):
-            old_img_path = os.path.join(image_folder_path, filename)
-            new_img_path = os.path.join(image_folder_path, 'img_' + filename)
-            os.rename(old_img_path, new_img_path)
-            return 'img_' + filename
-
-    def rename_image_links(self, image_folder_path, topic_folder_path):
-        if not image_folder_path or not topic_folder_path:
-            return
-        for image_name in os.listdir(image_folder_path):
-            new_image_name = self.rename_image_file(image_name, image_folder_path)
-            for topic_file in os.listdir(topic_folder_path):
-                full_path = os.path.join(topic_folder_path, topic_file)
-                tree = etree.parse(full_path)
-                root = tree.getroot()
-                for image in root.iter('img'):
-                    path = image.attrib.get('src')
-                    path_parts = path.split('/')
-                    if path_parts[-1] == image_name:
-                        new_path = path.replace(image_name, new_image_name)
-                        image.set('src', new_path)
-                tree.write(full_path)
-
     def call_rename_image_links(self):
         project_path = self.project_var.get()
         if project_path:
-            image_folder = os.path.join(project_path, 'Content', 'Resources', 'Images', 'final-pics')
-            topic_folder = os.path.join(project_path, 'Content', 'MyTopics')
-            if os.path.exists(image_folder) and os.path.exists(topic_folder):
-                self.rename_image_links(image_folder, topic_folder)
-                messagebox.showinfo('Done!', 'Images renamed, links in topics updated.')
+            result = process_project(project_path, workers=os.cpu_count() or 1)
+            if 'error' in result:
+                messagebox.showerror('Error', 'Images not renamed: ' + result['error'])
+            elif result['failed_topics']:
+                messagebox.showwarning('Done', 'Images renamed, but some topics could not be updated:\n'
+                                       + '\n'.join(result['failed_topics']))
+            else:
+                messagebox.showinfo('Done!', 'Images renamed: %d, topics updated: %d.'
+                                    % (result['images'], result['updated_topics']))
 
     def select_folder(self):
         folder = filedialog.askdirectory()
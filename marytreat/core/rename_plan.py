@@ -0,0 +1,179 @@
+import argparse
+import csv
+import json
+import logging
+import sys
+
+from marytreat.core import mary_debug
+from marytreat.core.mary_debug import logger, set_log_level
+from marytreat.core.mary_xml import retarget_link
+
+"""
+Preview of the renames made by LocalMap.rename_topics and LocalMap.edit_image_names.
+The plan is computed in memory, without renaming or writing any file, and can be saved as JSON or CSV
+for a review. A reviewed plan is applied as it is, without working out the names again.
+
+Usage:
+    python -m marytreat rename-plan my_guide.ditamap --image-prefix guide --output plan.csv
+    python -m marytreat rename-plan my_guide.ditamap --apply plan.csv
+"""
+
+
+class PlannedChange:
+    """
+    One row of a rename plan.
+    Kinds: 'rename-topic' and 'rename-image' for the files to rename,
+    'xref', 'link', 'topicref' and 'image' for the elements whose hrefs change with them.
+    The file is the renamed file or the file with the element, by its current name.
+    """
+
+    fields: tuple[str, ...] = ('kind', 'file', 'old', 'new', 'title', 'repetition')
+
+    def __init__(self, kind: str, file: str, old: str, new: str, title: str | None = None,
+                 repetition: int | None = None) -> None:
+        self.kind = kind
+        self.file = file
+        self.old = old
+        self.new = new
+        self.title = title
+        self.repetition = repetition  # number of the topic among the topics with the same title
+
+    def __repr__(self) -> str:
+        return '<PlannedChange: %s %s: %s -> %s>' % (self.kind, self.file, self.old, self.new)
+
+    def as_dict(self) -> dict:
+        return {f: getattr(self, f) for f in self.fields}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> 'PlannedChange':
+        repetition = d.get('repetition')
+        return cls(d['kind'], d['file'], d['old'], d['new'], d.get('title') or None,
+                   int(repetition) if repetition not in (None, '') else None)
+
+
+class RenamePlan:
+
+    def __init__(self, map_path: str, changes: list[PlannedChange] | None = None) -> None:
+        self.map_path = map_path
+        self.changes: list[PlannedChange] = changes or []
+
+    def __repr__(self) -> str:
+        return '<RenamePlan: %s, %s>' % (self.map_path, self.counts())
+
+    def add(self, *args, **kwargs) -> None:
+        self.changes.append(PlannedChange(*args, **kwargs))
+
+    def counts(self) -> dict[str, int]:
+        counts: dict[str, int] = {}
+        for change in self.changes:
+            counts[change.kind] = counts.get(change.kind, 0) + 1
+        return counts
+
+    def topic_renames(self) -> list[tuple[str, str]]:
+        """
+        :return: old and new topic file names
+        """
+        return [(c.old, c.new) for c in self.changes if c.kind == 'rename-topic']
+
+    def image_renames(self) -> list[tuple[str, str]]:
+        """
+        :return: old and new image hrefs
+        """
+        return [(c.old, c.new) for c in self.changes if c.kind == 'rename-image']
+
+    def save(self, path: str) -> None:
+        """
+        Write the plan as CSV if the path ends with .csv, otherwise as JSON.
+        """
+        if path.endswith('.csv'):
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=PlannedChange.fields)
+                writer.writeheader()
+                writer.writerows(c.as_dict() for c in self.changes)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'map': self.map_path, 'changes': [c.as_dict() for c in self.changes]}, f, indent=1)
+        logger.info('Rename plan written to ' + path)
+
+    @classmethod
+    def load(cls, path: str, map_path: str | None = None) -> 'RenamePlan':
+        """
+        :param map_path: map the plan is for; a CSV file does not record it
+        """
+        if path.endswith('.csv'):
+            with open(path, encoding='utf-8', newline='') as f:
+                return cls(map_path, [PlannedChange.from_dict(row) for row in csv.DictReader(f)])
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(map_path or data['map'], [PlannedChange.from_dict(d) for d in data['changes']])
+
+
+def plan_renames(ditamap, image_prefix: str | None = None, topics: bool = True) -> RenamePlan:
+    """
+    Work out the topic renames, the image renames if there is an image prefix,
+    and every link, topicref and image href that would change with them.
+    The references are found in the link index and in the image sets of the topics, without searching the files.
+    """
+    plan = RenamePlan(ditamap.path)
+    with ditamap.lock:
+        if topics:
+            renames, _ = ditamap.plan_topic_renames()
+            new_names = {topic.name: new_name for topic, new_name, _ in renames}
+            for topic, new_name, num_rep in renames:
+                plan.add('rename-topic', topic.name, topic.name, new_name, topic.planned_title(), num_rep)
+            for old_name, new_name in new_names.items():
+                for t, link in ditamap.link_index.get(old_name, []):
+                    href = link.attrib.get('href')
+                    plan.add(link.tag, t.name, href, retarget_link(href, new_name))
+            for m in ditamap.related_maps:
+                for topicref in m.content.root.iter('topicref'):
+                    href = topicref.attrib.get('href')
+                    if href in new_names:
+                        plan.add('topicref', m.name, href, new_names[href])
+        if image_prefix:
+            new_hrefs = dict(ditamap.plan_image_renames(image_prefix))
+            for img, new_href in new_hrefs.items():
+                plan.add('rename-image', img.href, img.href, new_href, img.title)
+            renamed = new_hrefs.keys()
+            for m in ditamap.related_maps:
+                for topic in m.topics:
+                    if renamed.isdisjoint(topic.images):
+                        continue
+                    for img_tag in topic.content.root.iter('image'):
+                        img = topic.ditamap.find_image(img_tag.attrib.get('href', ''))
+                        if img in new_hrefs:
+                            plan.add('image', topic.name, img_tag.attrib.get('href'), new_hrefs[img])
+    return plan
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m marytreat rename-plan',
+                                     description='Preview topic and image renames, or apply a reviewed plan.')
+    parser.add_argument('map', help='ditamap')
+    parser.add_argument('--image-prefix', help='plan image renames with this prefix as well')
+    parser.add_argument('--no-topics', action='store_true', help='do not plan topic renames')
+    parser.add_argument('--output', help='file for the plan, .json or .csv (default: JSON on standard output)')
+    parser.add_argument('--apply', metavar='PLAN', help='apply a plan saved earlier instead of making one')
+    parser.add_argument('--lazy', action='store_true', help='parse topics only when they are needed')
+    parser.add_argument('--use-index', action='store_true', help='keep a project index next to the map')
+    parser.add_argument('--verbose', action='store_true', help='print informational log messages')
+    args = parser.parse_args(argv)
+
+    mary_debug.headless = True
+    set_log_level('console', logging.INFO if args.verbose else logging.WARNING)
+    from marytreat.core.local import LocalMap
+    ditamap = LocalMap(args.map, lazy=args.lazy, use_index=args.use_index)
+    if args.apply:
+        plan = RenamePlan.load(args.apply, ditamap.path)
+        topic_count, image_count = ditamap.apply_rename_plan(plan)
+        print('Renamed %d topics and %d images' % (topic_count, image_count), file=sys.stderr)
+        return 0
+    plan = plan_renames(ditamap, args.image_prefix, not args.no_topics)
+    if args.output:
+        plan.save(args.output)
+    else:
+        json.dump({'map': plan.map_path, 'changes': [c.as_dict() for c in plan.changes]}, sys.stdout, indent=1)
+        print()
+    print('Planned: ' + (', '.join('%d %s' % (n, kind) for kind, n in plan.counts().items()) or 'nothing'),
+          file=sys.stderr)
+    return 0
@@ -10,19 +10,22 @@ Long-running threaded functions
 
 
 class ThreadedLocalMapFactory(Thread):
-    def __init__(self, file_path, process_word_flag, q):
+    def __init__(self, file_path, process_word_flag, q, workers=0, lazy=False, use_index=False):
         super().__init__(daemon=True)
         self.q = q
         self.file_path = file_path
         self.process_word_flag = process_word_flag
+        self.workers = workers
+        self.lazy = lazy
+        self.use_index = use_index
 
     def run(self):
         from marytreat.core.local import LocalMap
-        mp = LocalMap(self.file_path)
+        mp = LocalMap(self.file_path, workers=self.workers, lazy=self.lazy, use_index=self.use_index)
         if mp.source == 'word' and self.process_word_flag.get() != 0:
             logger.info('Processing map derived from a Word file')
             mp.cast_topics_from_word()
-            process_word.after_conversion(mp.folder)
+            process_word.after_conversion(mp.folder, mp)
         self.q.put(mp)
 
 
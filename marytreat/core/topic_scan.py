@@ -0,0 +1,70 @@
+import os
+from io import BytesIO
+from typing import Iterable, Iterator
+
+from lxml import etree
+
+from marytreat.core.local_files import file_buffer
+from marytreat.core.mary_xml import title_missing, shortdesc_missing, tag_text
+from marytreat.core.project_index import TopicFacts
+
+"""
+Streaming scan of topics for audits that only need the title, the shortdesc, the outputclass
+and the presence of draft comments. No full tree is built: the parser stops at the topic body,
+and draft comments are found in the raw file contents.
+"""
+
+# The title and the shortdesc come before any of these in a DITA topic
+body_tags: set[str] = {'body', 'conbody', 'taskbody', 'refbody', 'prolog'}
+
+
+def scan_topic(topic_path: str) -> TopicFacts:
+    with file_buffer(topic_path) as data:
+        return scan_buffer(topic_path, data)
+
+
+def scan_buffer(topic_path: str, data) -> TopicFacts:
+    title_tag = None
+    shortdesc_tag = None
+    outputclass = None
+    depth = 0
+    source = BytesIO(data) if isinstance(data, bytes) else data  # a memory-mapped file can be read directly
+    for event, element in etree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if depth == 0:
+                outputclass = element.attrib.get('outputclass')
+            elif depth == 1 and element.tag in body_tags:
+                break
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        if element.tag == 'title' and title_tag is None:
+            title_tag = element
+        elif element.tag == 'shortdesc' and shortdesc_tag is None:
+            shortdesc_tag = element
+        else:
+            element.clear()  # keep memory flat for unusual topics without a body
+        if title_tag is not None and shortdesc_tag is not None:
+            break
+    return TopicFacts(topic_path,
+                      title=tag_text(title_tag),
+                      title_missing=title_missing(title_tag),
+                      shortdesc=tag_text(shortdesc_tag),
+                      shortdesc_missing=shortdesc_missing(shortdesc_tag),
+                      outputclass=outputclass,
+                      has_draft_comments=data.find(b'<draft-comment', 0) != -1)
+
+
+def scan_topics(topic_paths: Iterable[str]) -> Iterator[TopicFacts]:
+    for topic_path in topic_paths:
+        yield scan_topic(topic_path)
+
+
+def scan_folder(folder: str) -> list[TopicFacts]:
+    """
+    Summaries of all the DITA topics in a folder, sorted by path.
+    """
+    topic_paths = sorted(os.path.join(folder, fl) for fl in os.listdir(folder) if fl.endswith('.dita'))
+    return list(scan_topics(topic_paths))
@@ -0,0 +1,249 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+from threading import Thread, Event
+
+from marytreat.core.mary_debug import logger
+
+"""
+Watch the folders of an open map and feed the files changed on disk into the map,
+so that edits made in another editor show up without reloading the whole map.
+On Linux, changes come from inotify. Elsewhere, or if inotify is not available, the folders are polled.
+"""
+
+# inotify event masks, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0)
+
+watched_events: int = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+event_header = struct.Struct('iIII')  # wd, mask, cookie, len; followed by the file name
+
+
+class InotifyChanges:
+    """
+    Changed files in a set of folders, from the Linux inotify API.
+    """
+
+    def __init__(self, folders: list[str]) -> None:
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.folders: dict[int, str] = {}
+        self.moved_from: dict[int, str] = {}  # cookie -> old path, until the matching MOVED_TO event
+        self.moves: dict[str, str] = {}
+        try:
+            self.add_folders(folders)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def add_folders(self, folders: list[str]) -> None:
+        """
+        Start watching the folders that are not watched yet.
+        """
+        watched = set(self.folders.values())
+        for folder in folders:
+            if folder in watched or not os.path.isdir(folder):
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), watched_events)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), 'inotify_add_watch failed: ' + folder)
+            self.folders[wd] = folder
+
+    def __repr__(self) -> str:
+        return '<InotifyChanges: ' + ', '.join(self.folders.values()) + '>'
+
+    def wait(self, timeout: float) -> set[str] | None:
+        """
+        :return: paths of the files that were created, modified, renamed or deleted,
+        or None if the kernel queue overflowed and anything could have changed
+        """
+        changed: set[str] = set()
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return changed
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = event_header.unpack_from(data, offset)
+            offset += event_header.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self.moved_from.clear()
+                return None
+            if wd in self.folders and name:
+                path = os.path.join(self.folders[wd], os.fsdecode(name))
+                changed.add(path)
+                # a rename within the watched folders is a MOVED_FROM and a MOVED_TO event with the same cookie
+                if mask & IN_MOVED_FROM:
+                    self.moved_from[cookie] = path
+                elif mask & IN_MOVED_TO and cookie in self.moved_from:
+                    self.moves[self.moved_from.pop(cookie)] = path
+        return changed
+
+    def take_moves(self) -> dict[str, str]:
+        """
+        :return: old path -> new path of the files renamed since the last call
+        """
+        moves, self.moves = self.moves, {}
+        self.moved_from.clear()
+        return moves
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingChanges:
+    """
+    Changed files in a set of folders, found by comparing the modification time and size of every file.
+    """
+
+    def __init__(self, folders: list[str], stopped: Event | None = None) -> None:
+        self.folders = list(folders)
+        self.stopped = stopped or Event()
+        self.states = self.scan()
+        self.moves: dict[str, str] = {}
+
+    def add_folders(self, folders: list[str]) -> None:
+        new_folders = [f for f in folders if f not in self.folders]
+        self.folders += new_folders
+        self.states.update(self.scan(new_folders))
+
+    def __repr__(self) -> str:
+        return '<PollingChanges: ' + ', '.join(self.folders) + '>'
+
+    def scan(self, folders: list[str] | None = None) -> dict[str, tuple[int, int]]:
+        states = {}
+        for folder in (self.folders if folders is None else folders):
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            stat = entry.stat()
+                            states[entry.path] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                continue
+        return states
+
+    def wait(self, timeout: float) -> set[str] | None:
+        self.stopped.wait(timeout)
+        states = self.scan()
+        changed = {path for path in states.keys() | self.states.keys() if states.get(path) != self.states.get(path)}
+        # a renamed file disappears from one path and appears at another with the same time and size
+        removed: dict[tuple[int, int], list[str]] = {}
+        added: dict[tuple[int, int], list[str]] = {}
+        for path in changed:
+            if path not in states:
+                removed.setdefault(self.states[path], []).append(path)
+            elif path not in self.states:
+                added.setdefault(states[path], []).append(path)
+        for state, old_paths in removed.items():
+            new_paths = added.get(state, [])
+            if len(old_paths) == 1 and len(new_paths) == 1:
+                self.moves[old_paths[0]] = new_paths[0]
+        self.states = states
+        return changed
+
+    def take_moves(self) -> dict[str, str]:
+        moves, self.moves = self.moves, {}
+        return moves
+
+    def close(self) -> None:
+        pass
+
+
+class MapWatcher(Thread):
+    """
+    Update an open LocalMap with the files that change in its folder, the folders of its topics and its image folder.
+    A topic file that is renamed on disk keeps its LocalTopic, which follows it to the new name.
+    Changes are collected for a short delay, so that an editor saving a file in several steps
+    causes one update. The topics that were updated are put in the queue, if there is one,
+    and so are the exceptions, to be shown by the Tk thread.
+    """
+
+    headless: bool = True  # no error dialogs from this thread
+
+    def __init__(self, ditamap, q=None, delay: float = 0.5, interval: float = 1.0, use_inotify: bool = True):
+        """
+        :param delay: seconds to wait for more changes after the first one
+        :param interval: seconds between checks for changes when polling
+        :param use_inotify: use inotify where it is available; otherwise, always poll the folders
+        """
+        super().__init__(daemon=True)
+        self.ditamap = ditamap
+        self.q = q
+        self.delay = delay
+        self.interval = interval
+        self.stopped = Event()
+        folders = self.get_folders()
+        self.changes = None
+        if use_inotify and sys.platform.startswith('linux'):
+            try:
+                self.changes = InotifyChanges(folders)
+            except (OSError, AttributeError) as e:  # AttributeError: libc without inotify
+                logger.warning('Cannot use inotify, polling for changes instead: ' + str(e))
+        if self.changes is None:
+            self.changes = PollingChanges(folders, self.stopped)
+        logger.info('Watching for changes: ' + repr(self.changes))
+
+    def get_folders(self) -> list[str]:
+        """
+        The map folder, the image folder and every folder with topics, also in subfolders of the map folder.
+        """
+        folders = [self.ditamap.folder, self.ditamap.image_folder]
+        folders += [os.path.dirname(t.path) for m in self.ditamap.related_maps for t in m.topics]
+        return list(dict.fromkeys(os.path.abspath(f) for f in folders))
+
+    def run(self) -> None:
+        try:
+            while not self.stopped.is_set():
+                changed = self.changes.wait(self.interval)
+                if changed is not None and len(changed) == 0:
+                    continue
+                if changed is not None and not self.stopped.wait(self.delay):
+                    more = self.changes.wait(0)
+                    changed = None if more is None else changed | more
+                if self.stopped.is_set():
+                    break
+                self.apply(changed, self.changes.take_moves())
+                try:
+                    self.changes.add_folders(self.get_folders())  # topics may have been added in new folders
+                except OSError as e:
+                    logger.warning('Cannot watch a new topic folder: ' + str(e))
+        finally:
+            self.changes.close()
+
+    def apply(self, changed: set[str] | None, moves: dict[str, str] | None = None) -> None:
+        try:
+            if changed is None:
+                logger.warning('Too many changes on disk, checking the whole map')
+                _, topics = self.ditamap.refresh(check_hash=True)
+                updated = list(topics)
+            else:
+                logger.debug('Changed on disk: %s', ', '.join(sorted(changed)))
+                updated = self.ditamap.apply_file_changes(changed, moves=moves)
+        except Exception as e:  # keep watching, the next change may fix a broken file
+            logger.warning('Cannot update the map: ' + str(e))
+            if self.q is not None:
+                self.q.put(e)
+            return
+        if self.q is not None and len(updated) > 0:
+            self.q.put(updated)
+
+    def stop(self) -> None:
+        self.stopped.set()
@@ -0,0 +1,108 @@
+import os
+from contextlib import contextmanager, ExitStack
+from threading import RLock
+
+from lxml import etree
+
+from marytreat.core.local import LocalMap, LocalTopic, Image
+from marytreat.core.mary_debug import logger, debugmethods
+
+"""
+Several ditamaps in one folder that reference the same topics, ex. a user guide and an admin guide
+built from a common set of files. Each shared topic is parsed once, and there is one set of images
+and one link index for all the maps, so that an operation on the workspace touches every file once
+and a renamed topic is updated in all the maps that reference it.
+"""
+
+
+@debugmethods
+class LocalWorkspace:
+
+    def __init__(self, folder: str, workers: int = 0, lazy: bool = False, use_index: bool = False) -> None:
+        """
+        :param folder: folder with the ditamaps and their topics
+        :param workers, lazy, use_index: passed to every LocalMap
+        """
+        self.folder = os.path.abspath(folder)
+        self.lazy = lazy or use_index  # the link index is built on demand, like in a single map
+        self.lock = RLock()
+        self.topics_by_path: dict[str, LocalTopic] = {}
+        self.images_by_path: dict[str, Image] = {}
+        self._link_index: dict[str, list[tuple[LocalTopic, etree.Element]]] | None = None
+        map_paths = [os.path.join(self.folder, f) for f in sorted(os.listdir(self.folder)) if f.endswith('.ditamap')]
+        if not map_paths:
+            raise FileNotFoundError('No ditamaps in ' + self.folder)
+        self.maps: list[LocalMap] = []
+        for map_path in map_paths:
+            logger.info('Loading map %s...', os.path.basename(map_path))
+            self.maps.append(LocalMap(map_path, workers, lazy, use_index, workspace=self))
+        if not self.lazy:
+            self.share_link_index()
+        logger.info('Workspace: %d maps, %d topics', len(self.maps), len(self.topics))
+
+    def __repr__(self) -> str:
+        return '<LocalWorkspace: ' + self.folder + ', ' + ', '.join(m.name for m in self.maps) + '>'
+
+    @property
+    def topics(self) -> list[LocalTopic]:
+        """
+        Topics of all the maps, each once, in map order.
+        """
+        return list(dict.fromkeys(t for m in self.maps for t in m.topics))
+
+    @property
+    def images(self) -> set[Image]:
+        return {img for m in self.maps for img in m.images}
+
+    def share_images(self, images: set[Image]) -> set[Image]:
+        """
+        Replace images that another map already has with the objects of that map,
+        so that a title found in one map is known to all of them.
+        """
+        shared = set()
+        for img in images:
+            path = os.path.normpath(os.path.join(img.ditamap.folder, img.href))
+            shared.add(self.images_by_path.setdefault(path, img))
+        return shared
+
+    def share_link_index(self) -> dict[str, list[tuple[LocalTopic, etree.Element]]]:
+        """
+        Build one link index over the topics of all the maps, and give it to every map.
+        """
+        self._link_index = self.maps[0].get_link_index(self.topics)
+        for m in self.maps:
+            m._link_index = self._link_index
+        return self._link_index
+
+    def reset_link_index(self) -> None:
+        """
+        Call this after the topics of a map have changed.
+        """
+        for m in self.maps:
+            m._link_index = None
+        if not self.lazy:
+            self.share_link_index()
+
+    @contextmanager
+    def write_behind(self):
+        """
+        Collect the writes of all the maps during an operation, and write each changed file once at the end.
+        """
+        with ExitStack() as stack:
+            for m in self.maps:
+                stack.enter_context(m.write_behind())
+            yield
+
+    def rename_topics(self) -> int:
+        return self.maps[0].rename_topics(self.topics)
+
+    def mass_edit(self) -> list[str]:
+        return self.maps[0].mass_edit(self.topics)
+
+    def edit_image_names(self, image_prefix: str) -> int:
+        return self.maps[0].edit_image_names(image_prefix, self.topics)
+
+    def refresh(self, check_hash: bool = False) -> None:
+        with self.lock:
+            for m in self.maps:
+                m.refresh(check_hash)
@@ -0,0 +1,179 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+
+import _initialize
+from generate_project import ProjectSpec, generate_project
+from marytreat.core import local as l
+from marytreat.core.mary_debug import set_log_level
+
+"""
+Times the local map operations on synthetic projects of several sizes,
+and records the results so that versions can be compared.
+
+Example:
+    python benchmark_local.py --scales 100 1000 3000 --output results.json
+    python benchmark_local.py --scales 100 1000 3000 --compare results.json
+
+Every operation runs on a fresh copy of the generated project. Only the operation itself is timed.
+"""
+
+operations: list[str] = ['load', 'cast_topics_from_word', 'rename_topics', 'edit_image_names', 'mass_edit',
+                         'after_conversion']
+
+
+def quiet_console() -> None:
+    """
+    Do not print every log message: printing would take longer than some of the operations.
+    The log file still gets everything.
+    """
+    set_log_level('console', logging.WARNING)
+
+
+def current_version() -> str:
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_operation(operation: str, map_path: str, map_options: dict) -> float | None:
+    """
+    :return: time in seconds, or None if the operation cannot run in this environment
+    """
+    if operation == 'after_conversion':
+        try:
+            from marytreat.core import process_word
+        except ImportError as e:
+            print('Skipping after_conversion: ' + str(e))
+            return None
+        start = time.perf_counter()
+        process_word.after_conversion(os.path.dirname(map_path))
+        return time.perf_counter() - start
+    if operation == 'load':
+        start = time.perf_counter()
+        l.LocalMap(map_path, **map_options)
+        return time.perf_counter() - start
+    ditamap = l.LocalMap(map_path, **map_options)
+    if ditamap.source == 'word' and operation != 'cast_topics_from_word':
+        ditamap.cast_topics_from_word()  # Word topics are typed before anything else, like in the app
+    start = time.perf_counter()
+    if operation == 'cast_topics_from_word':
+        ditamap.cast_topics_from_word()
+    elif operation == 'rename_topics':
+        ditamap.rename_topics()
+    elif operation == 'edit_image_names':
+        ditamap.edit_image_names('bench')
+    elif operation == 'mass_edit':
+        ditamap.mass_edit()
+    return time.perf_counter() - start
+
+
+def benchmark(scales: list[int], layout: str = 'word', repeat: int = 1, selected: list[str] | None = None,
+              map_options: dict | None = None, **spec_options) -> list[dict]:
+    """
+    :param scales: numbers of topics
+    :param repeat: runs per operation; the best time is recorded
+    :param selected: operations to run, all by default
+    :param map_options: keyword arguments for LocalMap, ex. {'lazy': True}
+    :param spec_options: other ProjectSpec parameters
+    """
+    map_options = map_options or {}
+    results = []
+    version = current_version()
+    work_folder = tempfile.mkdtemp(prefix='marytreat_benchmark_')
+    try:
+        for topics in scales:
+            spec = ProjectSpec(topics=topics, images=max(1, topics // 5), layout=layout, **spec_options)
+            template = os.path.join(work_folder, 'template')
+            template_map = generate_project(template, spec)
+            for operation in selected or operations:
+                if operation in ('cast_topics_from_word', 'after_conversion') and layout != 'word':
+                    continue
+                times = []
+                for run in range(repeat):
+                    project = os.path.join(work_folder, 'project')
+                    shutil.rmtree(project, ignore_errors=True)
+                    shutil.copytree(template, project)
+                    seconds = run_operation(operation, os.path.join(project, os.path.basename(template_map)),
+                                            map_options)
+                    if seconds is None:
+                        break
+                    times.append(seconds)
+                if not times:
+                    continue
+                result = {'version': version, 'python': platform.python_version(), 'layout': layout,
+                          'topics': topics, 'options': map_options, 'operation': operation,
+                          'seconds': round(min(times), 4), 'runs': len(times)}
+                results.append(result)
+                print('%-22s %6d topics  %8.3f s' % (operation, topics, result['seconds']))
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+    return results
+
+
+def save_results(results: list[dict], path: str) -> None:
+    """
+    Append the results to a JSON file, so that it collects runs of several versions.
+    """
+    previous = load_results(path) if os.path.exists(path) else []
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(previous + results, f, indent=1)
+    print('Wrote ' + path)
+
+
+def load_results(path: str) -> list[dict]:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(results: list[dict], baseline: list[dict]) -> None:
+    """
+    Print the time of each operation next to the latest recorded time for the same layout, size and options.
+    """
+    latest = {}
+    for r in baseline:
+        latest[(r['layout'], r['topics'], json.dumps(r.get('options', {}), sort_keys=True), r['operation'])] = r
+    print('\n%-22s %6s %10s %10s %8s' % ('operation', 'topics', 'before', 'now', 'ratio'))
+    for r in results:
+        before = latest.get((r['layout'], r['topics'], json.dumps(r['options'], sort_keys=True), r['operation']))
+        if before is None:
+            print('%-22s %6d %10s %10.3f' % (r['operation'], r['topics'], '-', r['seconds']))
+            continue
+        ratio = r['seconds'] / before['seconds'] if before['seconds'] else float('inf')
+        print('%-22s %6d %10.3f %10.3f %7.2fx  (%s)' % (r['operation'], r['topics'], before['seconds'],
+                                                        r['seconds'], ratio, before['version']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the local map operations on synthetic projects.')
+    parser.add_argument('--scales', type=int, nargs='+', default=[100, 1000, 3000], help='numbers of topics')
+    parser.add_argument('--layout', choices=['word', 'cheetah'], default='word')
+    parser.add_argument('--operations', nargs='+', choices=operations, default=None)
+    parser.add_argument('--repeat', type=int, default=1, help='runs per operation, the best time is recorded')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--xrefs', type=float, default=1.0)
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--lazy', action='store_true')
+    parser.add_argument('--use-index', action='store_true')
+    parser.add_argument('--output', help='JSON file to append the results to')
+    parser.add_argument('--compare', help='JSON file with earlier results')
+    parser.add_argument('--verbose', action='store_true', help='print all log messages')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        quiet_console()
+    options = {k: v for k, v in [('workers', args.workers), ('lazy', args.lazy), ('use_index', args.use_index)] if v}
+    run_results = benchmark(args.scales, args.layout, args.repeat, args.operations, options,
+                            depth=args.depth, xrefs=args.xrefs)
+    if args.compare:
+        compare(run_results, load_results(args.compare))
+    if args.output:
+        save_results(run_results, args.output)
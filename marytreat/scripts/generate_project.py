@@ -0,0 +1,228 @@
+import argparse
+import os
+import random
+import shutil
+
+"""
+Generates a synthetic DITA project for testing and benchmarking the local map operations.
+The project looks like the output of either converter MaryTreat works with:
+- 'word': Oxygen batch Word to DITA converter. Generic topics without outputclasses,
+  images in the 'media' folder, a document details topic first in the map.
+- 'cheetah': Cheetah to DITA converter. Typed topics with outputclasses, each with a .3sish pair,
+  images in the map folder.
+The same parameters and seed always produce the same project.
+"""
+
+header = '<?xml version="1.0" encoding="UTF-8"?>\n'
+doctypes: dict[str, str] = {
+    'topic': '<!DOCTYPE topic PUBLIC "-//OASIS//DTD DITA Topic//EN" "topic.dtd">\n',
+    'concept': '<!DOCTYPE concept PUBLIC "-//OASIS//DTD DITA Concept//EN" "concept.dtd">\n',
+    'task': '<!DOCTYPE task PUBLIC "-//OASIS//DTD DITA Task//EN" "task.dtd">\n',
+    'reference': '<!DOCTYPE reference PUBLIC "-//OASIS//DTD DITA Reference//EN" "reference.dtd">\n',
+    'map': '<!DOCTYPE map PUBLIC "-//OASIS//DTD DITA Map//EN" "map.dtd">\n'
+}
+
+# Cheetah topic kind -> root tag, body tag
+topic_kinds: dict[str, tuple[str, str]] = {
+    'explanation': ('concept', 'conbody'),
+    'procedure': ('task', 'taskbody'),
+    'referenceinformation': ('reference', 'refbody'),
+    'context': ('concept', 'conbody')
+}
+
+verbs: list[str] = ['Replacing', 'Cleaning', 'Calibrating', 'Installing', 'Checking', 'Adjusting']
+nouns: list[str] = ['the ink cabinet', 'the blanket', 'the feeder', 'the stacker', 'the PIP', 'the BID']
+# Titles that MaryTreat mass edits
+typical_titles: list[str] = ['Revision history', 'Printing instructions']
+
+# Tiny valid PNG, 1x1 pixel
+png_data: bytes = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082')
+
+
+class ProjectSpec:
+    """
+    Parameters of a synthetic project.
+    """
+
+    def __init__(self, topics: int = 100, depth: int = 3, xrefs: float = 1.0, images: int = 20,
+                 layout: str = 'word', seed: int = 0) -> None:
+        """
+        :param topics: number of topics in the map
+        :param depth: maximum nesting depth of topicrefs
+        :param xrefs: average number of local links per topic
+        :param images: number of image files; each image is used in one or more topics
+        :param layout: 'word' or 'cheetah'
+        :param seed: seed for the random choices
+        """
+        if layout not in ('word', 'cheetah'):
+            raise ValueError('Unknown project layout: ' + layout)
+        self.topics = topics
+        self.depth = max(1, depth)
+        self.xrefs = xrefs
+        self.images = images
+        self.layout = layout
+        self.seed = seed
+
+    def __repr__(self) -> str:
+        return '<ProjectSpec: %s, %d topics, depth %d, %.1f xrefs/topic, %d images>' % (
+            self.layout, self.topics, self.depth, self.xrefs, self.images)
+
+
+def topic_title(rng: random.Random, i: int) -> str:
+    if i in (1, 2):
+        return typical_titles[i - 1]
+    if rng.random() < 0.05:  # repeated titles get numbered when renaming
+        return rng.choice(verbs) + ' ' + rng.choice(nouns)
+    return rng.choice(verbs) + ' ' + rng.choice(nouns) + ' ' + str(i)
+
+
+def topic_kind(rng: random.Random, has_children: bool) -> str:
+    if has_children:
+        return 'context'
+    return rng.choice(['explanation', 'procedure', 'referenceinformation'])
+
+
+def body_elements(rng: random.Random, kind: str, i: int, names: list[str], image_hrefs: list[str],
+                  spec: ProjectSpec) -> str:
+    elements = []
+    if kind == 'procedure':
+        elements += ['<p>%d. Do step %d of the procedure.</p>' % (n, n) for n in range(1, 4)]
+    elif kind == 'referenceinformation':
+        elements.append('<table><tgroup cols="2"><tbody><row><entry>Part</entry><entry>%d</entry></row>'
+                        '</tbody></tgroup></table>' % i)
+    else:
+        elements.append('<p>Paragraph about topic %d.</p>' % i)
+    if rng.random() < 0.1:
+        elements.append('<p>NOTE: Read this before continuing.</p>')
+    # the number of links per topic is spread around the average
+    for n in range(int(spec.xrefs) + (1 if rng.random() < spec.xrefs % 1 else 0)):
+        target = rng.choice(names)
+        elements.append('<p>See <xref scope="local" href="%s#%s">related topic</xref>.</p>'
+                        % (target, os.path.splitext(target)[0]))
+    if image_hrefs and rng.random() < 0.5:
+        href = rng.choice(image_hrefs)
+        title = 'Figure of ' + rng.choice(nouns)
+        elements.append('<fig><title>%s</title><image href="%s"><alt>%s</alt></image></fig>' % (title, href, title))
+    if rng.random() < 0.05:
+        elements.append('<draft-comment>Check this topic</draft-comment>')
+    return ''.join(elements)
+
+
+def word_topic(rng, i, title, names, image_hrefs, spec, has_children) -> str:
+    if i == 0:
+        body = ('<p>Document details</p><p><b>Document title and version</b></p>'
+                '<p><ph varref="DocTitle">Synthetic guide</ph></p>'
+                '<table><tgroup cols="2"><tbody><row><entry>Version</entry><entry>1</entry></row>'
+                '</tbody></tgroup></table>')
+    else:
+        body = body_elements(rng, topic_kind(rng, has_children), i, names, image_hrefs, spec)
+    return (header + doctypes['topic'] + '<topic id="topic_%d">\n<title>%s</title>\n<body>%s</body>\n</topic>\n'
+            % (i, title, body))
+
+
+def cheetah_topic(rng, i, title, names, image_hrefs, spec, has_children) -> str:
+    kind = topic_kind(rng, has_children)
+    root_tag, body_tag = topic_kinds[kind]
+    shortdesc = '' if rng.random() < 0.1 else '<shortdesc>Short description of topic %d.</shortdesc>\n' % i
+    body = body_elements(rng, kind, i, names, image_hrefs, spec)
+    return (header + doctypes[root_tag] + '<%s id="topic_%d" outputclass="%s">\n<title>%s</title>\n%s<%s>%s</%s>\n</%s>\n'
+            % (root_tag, i, kind, title, shortdesc, body_tag, body, body_tag, root_tag))
+
+
+def ish_file(name: str, kind: str) -> str:
+    return (header + '<ishobject ishref="GUID-%s" ishtype="ISHModule">\n<ishfields>\n'
+            '<ishfield name="FTITLE" level="logical">%s</ishfield>\n'
+            '<ishfield name="VERSION" level="version">1</ishfield>\n'
+            '<ishfield name="DOC-LANGUAGE" level="lng">en-US</ishfield>\n'
+            '<ishfield name="FMODULETYPE" level="logical">%s</ishfield>\n'
+            '</ishfields>\n</ishobject>\n' % (name.upper(), name, kind.capitalize()))
+
+
+def topic_tree(rng: random.Random, spec: ProjectSpec) -> list[int]:
+    """
+    :return: parent topic of each topic, or -1 for topics at the top level of the map
+    """
+    parents = []
+    levels = []
+    for i in range(spec.topics):
+        candidates = [j for j in range(max(0, i - 20), i) if levels[j] < spec.depth - 1]
+        if i == 0 or not candidates or rng.random() < 0.3:
+            parents.append(-1)
+            levels.append(0)
+        else:
+            parent = rng.choice(candidates)
+            parents.append(parent)
+            levels.append(levels[parent] + 1)
+    if spec.layout == 'word' and spec.topics > 0:
+        for i in range(spec.topics):  # the document details topic has no children
+            if parents[i] == 0:
+                parents[i] = -1
+                levels[i] = 0
+    return parents
+
+
+def generate_project(folder: str, spec: ProjectSpec | None = None) -> str:
+    """
+    Create a synthetic project in a folder. The folder is cleared first.
+    :return: path to the map
+    """
+    spec = spec or ProjectSpec()
+    rng = random.Random(spec.seed)
+    shutil.rmtree(folder, ignore_errors=True)
+    image_folder = os.path.join(folder, 'media') if spec.layout == 'word' else folder
+    os.makedirs(image_folder, exist_ok=True)
+
+    image_hrefs = []
+    for i in range(spec.images):
+        name = 'image%d.png' % (i + 1)
+        with open(os.path.join(image_folder, name), 'wb') as f:
+            f.write(png_data)
+        image_hrefs.append('media/' + name if spec.layout == 'word' else name)
+
+    names = ['topic_%05d.dita' % i for i in range(spec.topics)]
+    parents = topic_tree(rng, spec)
+    has_children = set(parents)
+    make_topic = word_topic if spec.layout == 'word' else cheetah_topic
+    for i, name in enumerate(names):
+        text = make_topic(rng, i, topic_title(rng, i), names, image_hrefs, spec, i in has_children)
+        with open(os.path.join(folder, name), 'w', encoding='utf-8') as f:
+            f.write(text)
+        if spec.layout == 'cheetah':
+            kind = 'context' if i in has_children else 'topic'
+            with open(os.path.join(folder, os.path.splitext(name)[0] + '.3sish'), 'w', encoding='utf-8') as f:
+                f.write(ish_file(os.path.splitext(name)[0], kind))
+
+    children: dict[int, list[int]] = {}
+    for i, parent in enumerate(parents):
+        children.setdefault(parent, []).append(i)
+
+    def topicref(i: int, indent: str) -> str:
+        if i not in children:
+            return indent + '<topicref href="%s"/>\n' % names[i]
+        nested = ''.join(topicref(child, indent + '  ') for child in children[i])
+        return indent + '<topicref href="%s">\n%s%s</topicref>\n' % (names[i], nested, indent)
+
+    map_path = os.path.join(folder, 'synthetic_guide.ditamap')
+    with open(map_path, 'w', encoding='utf-8') as f:
+        f.write(header + doctypes['map'] + '<map>\n<title>Synthetic guide</title>\n')
+        for i in children.get(-1, []):
+            f.write(topicref(i, '  '))
+        f.write('</map>\n')
+    return map_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic DITA project.')
+    parser.add_argument('folder', help='output folder; it is cleared first')
+    parser.add_argument('--topics', type=int, default=100)
+    parser.add_argument('--depth', type=int, default=3, help='maximum nesting depth of topicrefs')
+    parser.add_argument('--xrefs', type=float, default=1.0, help='average number of local links per topic')
+    parser.add_argument('--images', type=int, default=20)
+    parser.add_argument('--layout', choices=['word', 'cheetah'], default='word')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    path = generate_project(args.folder, ProjectSpec(args.topics, args.depth, args.xrefs, args.images,
+                                                     args.layout, args.seed))
+    print('Wrote ' + path)
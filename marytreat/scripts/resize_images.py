@@ -1,107 +1,160 @@
-from msvcrt import getch
 import os
+import struct
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from msvcrt import getch
+except ImportError:  # not on Windows
+    def getch():
+        input()
 
 """
 Requires ImageMagick installed.
+The resolution and size of the images are read from the PNG files themselves;
+ImageMagick only converts the images that need it, several at a time.
 """
 
-print("""
+png_signature = b'\x89PNG\r\n\x1a\n'
+chunk_header = struct.Struct('>I4s')  # length, type
+inches_per_meter = 0.0254
+
+
+def read_png_info(path: str) -> tuple[float, int, int]:
+    """
+    Read the header chunks of a PNG file, up to the image data.
+    :return: horizontal resolution in pixels per inch (0 if the file does not say), width and height in pixels
+    """
+    resolution = 0.0
+    with open(path, 'rb') as f:
+        if f.read(len(png_signature)) != png_signature:
+            raise ValueError('Not a PNG file: ' + path)
+        length, chunk_type = chunk_header.unpack(f.read(chunk_header.size))
+        if chunk_type != b'IHDR':
+            raise ValueError('PNG file without a header: ' + path)
+        width, height = struct.unpack('>II', f.read(8))
+        f.seek(length - 8 + 4, os.SEEK_CUR)  # rest of the header and its CRC
+        while True:
+            data = f.read(chunk_header.size)
+            if len(data) < chunk_header.size:
+                break
+            length, chunk_type = chunk_header.unpack(data)
+            if chunk_type == b'pHYs':
+                pixels_per_unit_x, _, unit = struct.unpack('>IIB', f.read(9))
+                if unit == 1:  # meter
+                    resolution = pixels_per_unit_x * inches_per_meter
+                break
+            if chunk_type in (b'IDAT', b'IEND'):  # pHYs comes before the image data
+                break
+            f.seek(length + 4, os.SEEK_CUR)
+    return resolution, width, height
+
+
+def is_vertical(w, h):
+    return h > (1.2 * w)
+
+
+def is_square(w, h):
+    return (h <= (1.2 * w) and h >= (0.85 * w))
+
+
+def plan_conversion(resolution: float, width: float, height: float) -> tuple[bool, int | None, str] | None:
+    """
+    :return: whether to set the resolution to 150 ppi, new width in pixels or None, description;
+    None if the image does not need converting
+    """
+    set_density = False
+    if resolution > 150 and width > 70:  # filter out things like icons
+        set_density = True
+    elif resolution < 148:
+        return None
+
+    if is_vertical(width, height) and width > 350:
+        return set_density, 300, 'vertical, to 2 inches wide'
+    elif not is_vertical(width, height) and width > 675:
+        return set_density, 675, 'horizontal, to 4.5 inches wide'
+    elif is_square(width, height) and width > 500:
+        return set_density, 450, 'square, to 3 inches wide'
+    if set_density:
+        return set_density, None, 'to 150 ppi'
+    return None
+
+
+def analyze(images_folder: str, image_list: list[str]) -> list[tuple[str, bool, int | None, str]]:
+    """
+    :return: images to convert, with the conversions they need
+    """
+    plan = []
+    for pngfile in image_list:
+        try:
+            conversion = plan_conversion(*read_png_info(os.path.join(images_folder, pngfile)))
+        except (OSError, ValueError, struct.error) as e:
+            print(pngfile, e)
+            continue
+        if conversion is not None:
+            plan.append((pngfile, *conversion))
+    return plan
+
+
+def convert(images_folder: str, pngfile: str, set_density: bool, new_width: int | None) -> None:
+    magick_mogrify = ['magick', 'mogrify']
+    if set_density:
+        magick_mogrify += ['-density', '150', '-units', 'PixelsPerInch']
+    if new_width is not None:
+        magick_mogrify += ['-resize', str(new_width)]
+    subprocess.run(magick_mogrify + [os.path.join(images_folder, pngfile)])
+
+
+def magick_convert(images_folder, image_list, dummy=False, workers=None):
+    """
+    :param image_list: list of PNGs to analyze and convert
+    :param dummy: for test runs
+    :param workers: number of conversions at the same time, as many as processors by default
+    :return: numbers of images converted to 150 ppi and of images resized
+    """
+    plan = analyze(images_folder, image_list)
+    for pngfile, set_density, new_width, description in plan:
+        print('Converting', pngfile + ':', description + ('' if new_width is None or not set_density
+                                                           else ', and to 150 ppi'))
+    if not dummy:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            futures = {pool.submit(convert, images_folder, p, d, w): p for p, d, w, _ in plan}
+            for future, pngfile in futures.items():
+                try:
+                    future.result()
+                except Exception as e:  # one failed image does not stop the others
+                    print(os.path.join(images_folder, pngfile), e)
+    too_large = sum(1 for _, set_density, _, _ in plan if set_density)
+    too_wide = sum(1 for _, _, new_width, _ in plan if new_width is not None)
+    return too_large, too_wide
+
+
+if __name__ == '__main__':
+    print("""
 This script requires ImageMagick installed on your computer.
 * Convert local pngs with too large resolutions into 150 ppi.
 * Convert too wide images:
   - 4.5 inches wide (675 px) for vertical
   - 2 inches wide for horizontal
-  
+
 It is recommended to backup the images folder before you run this script.
 
 """)
 
-images_folder = input('Enter the path to the local images folder: ')
+    images_folder = input('Enter the path to the local images folder: ')
 
-try:
-    pngs = [fl for fl in os.listdir(images_folder) if fl.endswith(('.png', '.PNG'))]
-except FileNotFoundError as e:
-    print(e)
-    print('Press any key to exit.')
-    getch()
-    exit()
+    try:
+        pngs = [fl for fl in os.listdir(images_folder) if fl.endswith(('.png', '.PNG'))]
+    except FileNotFoundError as e:
+        print(e)
+        print('Press any key to exit.')
+        getch()
+        exit()
 
-too_large = []
-reso_right_but_too_wide = []
+    too_large, too_wide = magick_convert(images_folder, pngs)
 
+    print()
+    print('Converted', too_large, 'files with resolution larger than 150.')
+    print('Converted', too_wide, 'files that were too wide.')
 
-def magick_convert(image_list, dummy=False):
-    """
-    :param image_list: list of PNGs to analyze and convert
-    :param dummy: for test runs
-    """
-    def analyze(fl):
-        print('Analyzing {}...'.format(fl))
-        magick_identify = ['magick', 'identify',
-                           '-format', '%[resolution.x] %[width] %[height]',
-                           '-units', 'PixelsPerInch',
-                           os.path.join(images_folder, fl)]
-        reso, w, h = subprocess.run(
-            magick_identify, capture_output=True, text=True
-        ).stdout.split(' ')
-        return float(reso), float(w), float(h)
-
-    def is_vertical(w, h):
-        return h > (1.2 * w)
-
-    def is_square(w, h):
-        return (h <= (1.2 * w) and h >= (0.85 * w))
-
-    for pngfile in image_list:
-        try:
-            resolution, width, height = analyze(pngfile)
-            if resolution > 150 and width > 70:  # filter out things like icons
-                too_large.append((pngfile, resolution))
-                print('Converting', pngfile, 'to 150 ppi...')
-                if not dummy:
-                    magick_density = ['magick', 'mogrify',
-                                      '-density', '150', '-units', 'PixelsPerInch',
-                                      os.path.join(images_folder, pngfile)]
-                    subprocess.run(magick_density)
-            elif resolution < 148:
-                continue
-
-            if is_vertical(width, height) and width > 350:
-                reso_right_but_too_wide.append((pngfile, width))
-                print('Converting vertical', pngfile, 'to 2 inches wide...')
-                if not dummy:
-                    magick_resize = ['magick', 'mogrify',
-                                     '-resize', '300',
-                                     os.path.join(images_folder, pngfile)]
-                    subprocess.run(magick_resize)
-            
-            elif not is_vertical(width, height) and width > 675:
-                reso_right_but_too_wide.append((pngfile, width))
-                print('Converting horizontal', pngfile, 'to 4.5 inches wide...')
-                if not dummy:
-                    magick_resize = ['magick', 'mogrify',
-                                     '-resize', '675',
-                                     os.path.join(images_folder, pngfile)]
-                    subprocess.run(magick_resize)
-                    
-            elif is_square(width, height) and width > 500:
-                reso_right_but_too_wide.append((pngfile, width))
-                print('Converting square', pngfile, 'to 3 inches wide...')
-                if not dummy:
-                    magick_resize = ['magick', 'mogrify',
-                                     '-resize', '450',
-                                     os.path.join(images_folder, pngfile)]
-                    subprocess.run(magick_resize)
-        except Exception as e:
-            print(e)
-
-
-magick_convert(pngs)
-# magick_convert(pngs)  # The second run catches too-wide files that weren't 150 ppi in the first run
-
-print()
-print('Converted', len(too_large), 'files with resolution larger than 150.')
-print('Converted', len(reso_right_but_too_wide), 'files that were too wide.')
-
-getch()
+    getch()
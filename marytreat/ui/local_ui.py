@@ -10,6 +10,7 @@ from marytreat.core.constants import Constants
 from marytreat.core.mary_debug import logger
 from marytreat.core.rename_flare_images import RenameImageFile
 from marytreat.core.threaded import ThreadedLocalMapFactory, ThreadedLocalTopicRenamer
+from marytreat.core.watcher import MapWatcher
 from marytreat.ui.utils import MaryProgressBar, get_icon, position_window
 
 padding = Constants.PADDING.value
@@ -71,6 +72,19 @@ class LocalMapProcessing(ttk.LabelFrame):
                                               state='disabled')
         self.button_edit_image_names.grid(row=2, column=2, sticky='ew', **self.padding)
 
+        self.watch_changes = IntVar(value=1)
+        do_watch_changes = ttk.Checkbutton(self, text='Watch for\nchanges on disk', variable=self.watch_changes)
+        do_watch_changes.grid(row=3, column=0, sticky='nw', **padding)
+
+        # Options for large projects
+        self.lazy_load = IntVar()
+        do_lazy_load = ttk.Checkbutton(self, text='Load topics on demand', variable=self.lazy_load)
+        do_lazy_load.grid(row=3, column=1, sticky='nw', **padding)
+
+        self.use_index = IntVar()
+        do_use_index = ttk.Checkbutton(self, text='Keep a project index', variable=self.use_index)
+        do_use_index.grid(row=3, column=2, sticky='nw', **padding)
+
     def call_select_map(self):
         """
         Show a file selection dialog. Remember the file that was selected.
@@ -80,7 +94,11 @@ class LocalMapProcessing(ttk.LabelFrame):
             self.ditamap_var.set(l.os.path.abspath(file))
             l.logger.debug('ditamap_var: ' + self.ditamap_var.get())
             self.pb.start()
-            t = ThreadedLocalMapFactory(l.os.path.abspath(file), self.process_word_map, self.q)
+            lazy = self.lazy_load.get() != 0
+            # topics loaded on demand are classified in parallel
+            workers = (l.os.cpu_count() or 1) if lazy else 0
+            t = ThreadedLocalMapFactory(l.os.path.abspath(file), self.process_word_map, self.q,
+                                        workers=workers, lazy=lazy, use_index=self.use_index.get() != 0)
             t.start()
             self.after(100, self.check_queue_for_map)
 
@@ -147,7 +165,7 @@ class LocalMapProcessing(ttk.LabelFrame):
 
     def call_get_problematic_files(self, *args):
         if self.ditamap:
-            new_window = MissingItemsWindow(self.ditamap)
+            new_window = MissingItemsWindow(self.ditamap, watch=self.watch_changes.get() != 0)
 
 
 class ImageNamesWindow:
@@ -195,7 +213,10 @@ class ImageNamesWindow:
 
 class MissingItemsWindow(Tk):
 
-    def __init__(self, ditamap):
+    def __init__(self, ditamap, watch=True):
+        """
+        :param watch: show edits made in other editors while the window is open
+        """
 
         super().__init__()
         self.iconbitmap(get_icon())
@@ -231,6 +252,31 @@ class MissingItemsWindow(Tk):
         self.grid_columnconfigure(0, weight=1)
         self.grid_columnconfigure(1, weight=1)
 
+        self.q = Queue()
+        self.watcher = MapWatcher(self.ditamap, self.q) if watch else None
+        if self.watcher is not None:
+            self.watcher.start()
+            self.protocol('WM_DELETE_WINDOW', self.close)
+            self.after(500, self.check_queue_for_changes)
+
+    def check_queue_for_changes(self):
+        try:
+            changed_topics = self.q.get_nowait()
+            if isinstance(changed_topics, Exception):  # shown here, the watcher thread cannot use Tk
+                logger.error('Cannot update the map: ' + str(changed_topics))
+            else:
+                logger.info('Changed on disk: ' + ', '.join(t.name for t in changed_topics))
+                self.refresh_table()
+                if self.open_topic in changed_topics:
+                    self.fill_text_frame(self.open_topic)
+        except Empty:
+            pass
+        self.after(500, self.check_queue_for_changes)
+
+    def close(self):
+        self.watcher.stop()
+        self.destroy()
+
     def create_table_frame(self):
 
         self.table_frame = Frame(self)
@@ -308,16 +354,10 @@ class MissingItemsWindow(Tk):
                 tags = 'greyed_out'
             if topic in pfiles:
                 pfiles.remove(topic)
-            content: l.XMLContent = topic.content
-            if content.title_missing():
-                has_title = '-'
-            else:
-                has_title = content.title_tag.text or ' '.join(list(content.title_tag.itertext()))
-            if content.shortdesc_missing():
-                has_shortdesc = '-'
-            else:
-                has_shortdesc = content.shortdesc_tag.text or ' '.join(list(content.shortdesc_tag.itertext()))
-            has_draft_comments = 'Yes' if len(content.draft_comments) > 0 else ''
+            summary = topic.get_summary()  # does not parse topics that have not been opened yet
+            has_title = '-' if summary.title_missing else summary.title
+            has_shortdesc = '-' if summary.shortdesc_missing else summary.shortdesc
+            has_draft_comments = 'Yes' if summary.has_draft_comments else ''
             topic_id_in_table = self.table.insert(parent_id, END, text=topic.name, open=False, tags=tags,
                                                   values=(has_title, has_shortdesc, has_draft_comments))
             if len(topic.children) > 0:
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from marytreat.core import mary_debug
+from marytreat.core.local import LocalMap
+
+mary_debug.headless = True
+
+# topic -> figures (image file, figure title). Some images are used in several topics with different titles,
+# and some titles repeat, so the new names depend on the titles that the images have after loading every topic.
+figures: dict[str, list[tuple[str, str]]] = {
+    'panel.dita': [('a.png', 'Front panel'), ('b.png', 'Stacker')],
+    'feeder.dita': [('c.png', 'Feeder'), ('a.png', 'Stacker')],
+    'stacker.dita': [('d.png', 'Stacker'), ('b.png', 'Feeder')],
+    'bid.dita': [('e.png', 'BID'), ('c.png', 'BID'), ('f.png', 'Feeder')],
+}
+
+
+def make_project(folder) -> str:
+    os.makedirs(os.path.join(folder, 'media'))
+    for image in sorted({img for figs in figures.values() for img, _ in figs}):
+        with open(os.path.join(folder, 'media', image), 'wb') as f:
+            f.write(b'\x89PNG\r\n\x1a\n')
+    for name, figs in figures.items():
+        body = ''.join('<fig><title>%s</title><image href="media/%s"/></fig>' % (title, img) for img, title in figs)
+        with open(os.path.join(folder, name), 'w', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<concept id="%s" outputclass="explanation"><title>%s</title><conbody>%s</conbody></concept>\n'
+                    % (name[:-5], name, body))
+    map_path = os.path.join(folder, 'guide.ditamap')
+    with open(map_path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<map><title>Guide</title>%s</map>\n'
+                % ''.join('<topicref href="%s"/>' % name for name in figures))
+    return map_path
+
+
+def planned_names(ditamap: LocalMap) -> dict[str, str]:
+    return {img.href: new_href for img, new_href in ditamap.plan_image_renames('guide')}
+
+
+@pytest.fixture
+def map_path(tmp_path) -> str:
+    return make_project(str(tmp_path))
+
+
+def test_lazy_map_names_images_like_eager_map(map_path):
+    eager = planned_names(LocalMap(map_path))
+    assert len(eager) == 6
+    assert planned_names(LocalMap(map_path, lazy=True)) == eager
+
+
+def test_map_restored_from_index_names_images_like_eager_map(map_path):
+    eager = planned_names(LocalMap(map_path))
+    LocalMap(map_path, use_index=True)  # writes the index
+    assert planned_names(LocalMap(map_path, use_index=True)) == eager
+
+
+def test_lazy_map_parsed_out_of_order_names_images_like_eager_map(map_path):
+    eager = planned_names(LocalMap(map_path))
+    ditamap = LocalMap(map_path, lazy=True)
+    for topic in reversed(ditamap.topics):
+        topic.content
+    assert planned_names(ditamap) == eager